@@ -13,13 +13,15 @@ from telegram.ext import (
 
 import config
 import database
+import file_generator
+from update_processor import PerUserUpdateProcessor
 from spiritual_feed import get_random_snippets
 
 # --- استيراد المعالجات من الملفات المنظمة ---
 from handlers.common_handlers import (
     start_cmd, myid_cmd, cancel_cmd, unknown_cmd, error_handler, contact_handler,
     contact_admin_start, forward_to_admin, report_bug_start, forward_bug_report,
-    download_pdf_handler, features_callback_router, health_check_cmd
+    download_pdf_handler, features_callback_router, health_check_cmd, sweep_pdf_cache
 )
 from handlers.main_handler import (
     handle_document_entry, handle_photo_entry, handle_text_entry,
@@ -40,7 +42,9 @@ from handlers.library_handler import (
 from handlers.admin_handler import (
     admin_entry, admin_panel_router, do_broadcast, handle_admin_pick_user,
     admin_activate_sub_from_button, admin_exit_to_main,
-    handle_set_tokens, handle_set_subs, admin_set_channel_apply  # ✨ 1. تم التأكد من استيراد الدالة
+    handle_set_tokens, handle_set_subs, admin_set_channel_apply,  # ✨ 1. تم التأكد من استيراد الدالة
+    handle_admin_dm_wait, handle_search_user, handle_schedule_broadcast,
+    handle_dm_user, handle_user_activity, handle_suggest_feature
 )
 
 # --- إعداد تسجيل الأخطاء (Logging) ---
@@ -93,6 +97,15 @@ async def push_spiritual_tip(context: ContextTypes.DEFAULT_TYPE):
             logger.debug("Spiritual tip not delivered to %s: %s", u['id'], send_err)
 
 
+async def _post_init(app) -> None:
+    # workers الـ PDF بتتولد وتسخن مع بداية البوت مش جوه أول طلب
+    file_generator.start_pdf_pool()
+
+
+async def _post_shutdown(app) -> None:
+    file_generator.stop_pdf_pool()
+
+
 def main():
     """Starts the bot."""
     if not config.TELEGRAM_BOT_TOKEN:
@@ -101,10 +114,22 @@ def main():
 
     database.setup_database()
     persistence = PicklePersistence(filepath="bot_persistence")
-    app = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).persistence(persistence).build()
+    # concurrent_updates: المستخدمين المختلفين بالتوازي بدل ما طلب AI/PDF طويل يوقف الباقي،
+    # بس تحديثات نفس المستخدم بالترتيب (الهاندلرز بتكتب الصف كله)
+    app = (
+        ApplicationBuilder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .persistence(persistence)
+        .concurrent_updates(PerUserUpdateProcessor())
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
 
     # بث روحاني ثابت كل 10 دقائق
     app.job_queue.run_repeating(push_spiritual_tip, interval=3600, first=120)
+    # تنظيف ملفات الـPDF القديمة من PDF_CACHE_DIR كل ساعة
+    app.job_queue.run_repeating(sweep_pdf_cache, interval=3600, first=300)
 
     # --- بناء معالجات المحادثات (Conversations) ---
 
@@ -121,6 +146,12 @@ def main():
             config.ADMIN_SET_TOKENS_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_set_tokens)],
             config.ADMIN_SET_SUBS_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_set_subs)],
             config.ADMIN_SET_CHANNEL_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_set_channel_apply)], # ✨ 2. تم إضافة الحالة هنا
+            config.ADMIN_DM_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_admin_dm_wait)],
+            config.ADMIN_SEARCH_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_search_user)],
+            config.ADMIN_SCHED_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_schedule_broadcast)],
+            config.ADMIN_DM_FREEFORM_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_dm_user)],
+            config.ADMIN_USER_ACTIVITY_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_user_activity)],
+            config.ADMIN_SUGGEST_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_suggest_feature)],
         },
         fallbacks=[
             CommandHandler("cancel", cancel_cmd),
@@ -0,0 +1,59 @@
+# broadcast.py
+"""Rate-limited fan-out to many users, shared by the admin panel and the admin text routes."""
+import asyncio
+
+from telegram.error import RetryAfter
+
+import db_async
+
+_BROADCAST_RATE = 30      # Telegram's global cap: ~30 messages/second per bot
+_BROADCAST_BATCH = 500    # tasks alive at once, so a 10k-user broadcast doesn't build 10k coroutines up front
+_BROADCAST_ATTEMPTS = 3   # per user, counting retries after a RetryAfter flood-wait
+
+
+async def broadcast(user_ids, send) -> int:
+    """Runs `await send(uid)` for every user concurrently, starting at most _BROADCAST_RATE sends
+    per second and keeping at most _BROADCAST_RATE in flight. Returns how many succeeded.
+    user_ids=None means every user in the database, streamed from SQLite one batch at a time."""
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(_BROADCAST_RATE)
+    interval = 1.0 / _BROADCAST_RATE
+    next_slot = loop.time()
+
+    async def _send_one(uid) -> bool:
+        nonlocal next_slot
+        async with sem:
+            # token bucket: each send reserves the next 1/30 s slot
+            now = loop.time()
+            slot = max(now, next_slot)
+            next_slot = slot + interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            for _ in range(_BROADCAST_ATTEMPTS):
+                try:
+                    await send(uid)
+                    return True
+                except RetryAfter as e:
+                    # Telegram طلب نهدى: نأجل كل الإرسال الجاي بنفس المدة ونعيد المحاولة
+                    delay = e.retry_after + 0.5
+                    next_slot = max(next_slot, loop.time() + delay)
+                    await asyncio.sleep(delay)
+                except Exception:
+                    return False  # Forbidden (المستخدم قافل البوت) وغيره: مفيش فايدة من الإعادة
+            return False
+
+    if user_ids is None:
+        batches = db_async.iter_user_id_chunks(_BROADCAST_BATCH)
+    else:
+        batches = _as_async_iter(user_ids[i:i + _BROADCAST_BATCH] for i in range(0, len(user_ids), _BROADCAST_BATCH))
+
+    sent = 0
+    async for batch in batches:
+        results = await asyncio.gather(*(_send_one(uid) for uid in batch))
+        sent += sum(results)
+    return sent
+
+
+async def _as_async_iter(iterable):
+    for item in iterable:
+        yield item
@@ -20,6 +20,10 @@ else:
 
 BOT_LINK = "t.me/AI_study1_bot"
 DATABASE_FILE = os.getenv("DATABASE_FILE", "bot_data.sqlite3")
+# ملفات الـPDF الجاهزة للتحميل (الجلسة بتحفظ المسار بس مش البايتات)
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+# أي ملف أقدم من كده بيتمسح (الجلسة اللي بتشاور عليه بترد "انتهت صلاحيته")
+PDF_CACHE_TTL_HOURS = int(os.getenv("PDF_CACHE_TTL_HOURS", 48))
 
 
 # --- إعدادات منطق البوت وحدود الاستخدام ---
@@ -43,9 +47,13 @@ MAX_TEXT_CHARS = 120_000
     ADMIN_CREDIT_SUB_WAIT,
     
     # ✨ --- [التعديل هنا] إضافة الحالات الجديدة --- ✨
-    ADMIN_SET_TOKENS_WAIT, ADMIN_SET_SUBS_WAIT 
+    ADMIN_SET_TOKENS_WAIT, ADMIN_SET_SUBS_WAIT,
 
-) = range(100, 109)
+    # حالات انتظار نص الأدمن (بدل flags في user_data)
+    ADMIN_SEARCH_WAIT, ADMIN_SCHED_WAIT, ADMIN_DM_FREEFORM_WAIT,
+    ADMIN_USER_ACTIVITY_WAIT, ADMIN_SUGGEST_WAIT
+
+) = range(100, 114)
 
 # Quiz Conversation States
 QZ_MENU, QZ_SETTINGS, QZ_RUNNING = range(200, 203)
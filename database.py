@@ -2,57 +2,136 @@
 import sqlite3
 import json
 import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 import config
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# --- اتصالات SQLite: pool صغير بدل فتح اتصال جديد مع كل نداء ---
+_POOL_SIZE = 8
+_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=_POOL_SIZE)
+
+def _open_connection() -> sqlite3.Connection:
+    # check_same_thread=False: الاتصال بيتنقل بين threads الـ pool بتاع asyncio.to_thread (كل مرة في thread واحد بس)
+    conn = sqlite3.connect(config.DATABASE_FILE, check_same_thread=False)
+    # WAL: القراءات ما بتستناش الكتابة، و synchronous=NORMAL كفاية معاه
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+@contextmanager
+def _connection() -> Iterator[sqlite3.Connection]:
+    """اتصال من الـ pool (أو جديد لو الـ pool فاضي)، وبيرجع للـ pool بعد الاستخدام."""
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+    try:
+        yield conn
+    finally:
+        # أي transaction ما اتعملهاش commit (exception مثلاً) بتتلغي، زي ما كان close() بيعمل
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+# --- كاش صفوف المستخدمين (TTL + LRU) ---
+# بنخزن الصف الخام (session/library كنصوص JSON)، فكل نداء بياخد dicts جديدة وتعديلها ما يلمسش الكاش.
+# كل كتابة على users بتمسح الصف المعني؛ والـ generation بيمنع قراءة قديمة تتحط في الكاش بعد كتابة أحدث منها.
+_USER_CACHE_TTL = 60.0
+_USER_CACHE_MAX = 10_000
+_user_rows: "OrderedDict[int, Tuple[float, dict]]" = OrderedDict()
+_user_rows_lock = threading.Lock()
+_user_rows_gen = 0
+
+def _cached_user_row(user_id: int) -> Optional[dict]:
+    with _user_rows_lock:
+        entry = _user_rows.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _user_rows[user_id]
+            return None
+        _user_rows.move_to_end(user_id)
+        return entry[1]
+
+def _store_user_row(user_id: int, row: dict, gen: int) -> None:
+    with _user_rows_lock:
+        if gen != _user_rows_gen:
+            return  # حصلت كتابة أثناء القراءة؛ الصف ده ممكن يكون قديم
+        _user_rows[user_id] = (time.monotonic() + _USER_CACHE_TTL, row)
+        _user_rows.move_to_end(user_id)
+        if len(_user_rows) > _USER_CACHE_MAX:
+            _user_rows.popitem(last=False)
+
+def _invalidate_user_rows(user_id: Optional[int] = None) -> None:
+    """يمسح صف مستخدم من الكاش (أو الكاش كله لو user_id=None) بعد أي كتابة."""
+    global _user_rows_gen
+    with _user_rows_lock:
+        _user_rows_gen += 1
+        if user_id is None:
+            _user_rows.clear()
+        else:
+            _user_rows.pop(user_id, None)
+
 def setup_database():
     """ينشئ جداول قاعدة البيانات إذا لم تكن موجودة."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
+    with _connection() as conn:
+        cursor = conn.cursor()
     
-    # جدول المستخدمين
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY,
-        name TEXT,
-        phone_number TEXT,
-        tokens INTEGER DEFAULT 0,
-        subscription_limit INTEGER DEFAULT 5,
-        files_processed INTEGER DEFAULT 0,
-        session TEXT, -- لتخزين بيانات الجلسة كـ JSON
-        library TEXT  -- لتخزين المكتبة كـ JSON
-    )''')
+        # جدول المستخدمين
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            phone_number TEXT,
+            tokens INTEGER DEFAULT 0,
+            subscription_limit INTEGER DEFAULT 5,
+            files_processed INTEGER DEFAULT 0,
+            session TEXT, -- لتخزين بيانات الجلسة كـ JSON
+            library TEXT  -- لتخزين المكتبة كـ JSON
+        )''')
     
-    # جدول الإعدادات العامة
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS settings (
-        key TEXT PRIMARY KEY,
-        value TEXT
-    )''')
-
-    # جدول سجلات الأدمن (مهم للأحداث)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS admin_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ts DATETIME DEFAULT CURRENT_TIMESTAMP,
-        action TEXT,
-        details TEXT
-    )''')
-
-    conn.commit()
-    conn.close()
+        # جدول الإعدادات العامة
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )''')
+
+        # جدول سجلات الأدمن (مهم للأحداث)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts DATETIME DEFAULT CURRENT_TIMESTAMP,
+            action TEXT,
+            details TEXT
+        )''')
+
+        conn.commit()
     logger.info("Database setup complete.")
 
 def _get_user_from_db(user_id: int) -> Optional[dict]:
     """يسترجع بيانات مستخدم واحد من قاعدة البيانات."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    user_row = cursor.fetchone()
-    conn.close()
+    user_row = _cached_user_row(user_id)
+    if user_row is None:
+        gen = _user_rows_gen
+        with _connection() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+            row = cursor.fetchone()
+        if row is not None:
+            user_row = dict(row)
+            _store_user_row(user_id, user_row, gen)
     if user_row:
         user_dict = dict(user_row)
         user_dict['session'] = json.loads(user_dict.get('session', '{}'))
@@ -66,20 +145,20 @@ def _update_user_in_db(user_id: int, user_data: dict):
     session_json = json.dumps(user_data.get('session', {}))
     library_json = json.dumps(user_data.get('library', {}))
     
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE users SET
-        name = ?, phone_number = ?, tokens = ?, subscription_limit = ?, 
-        files_processed = ?, session = ?, library = ?
-    WHERE id = ?
-    ''', (
-        user_data.get('name'), user_data.get('phone_number'), user_data.get('tokens'),
-        user_data.get('subscription_limit'), user_data.get('files_processed'),
-        session_json, library_json, user_id
-    ))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE users SET
+            name = ?, phone_number = ?, tokens = ?, subscription_limit = ?, 
+            files_processed = ?, session = ?, library = ?
+        WHERE id = ?
+        ''', (
+            user_data.get('name'), user_data.get('phone_number'), user_data.get('tokens'),
+            user_data.get('subscription_limit'), user_data.get('files_processed'),
+            session_json, library_json, user_id
+        ))
+        conn.commit()
+    _invalidate_user_rows(user_id)
 
 def ensure_user(user_id: int, name: str) -> Dict[str, Any]:
     """
@@ -113,56 +192,165 @@ def ensure_user(user_id: int, name: str) -> Dict[str, Any]:
     session_json = json.dumps(new_user['session'])
     library_json = json.dumps(new_user['library'])
 
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO users (id, name, phone_number, tokens, subscription_limit, files_processed, session, library)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        user_id, name, None, new_user['tokens'], new_user['subscription_limit'], 0,
-        session_json, library_json
-    ))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO users (id, name, phone_number, tokens, subscription_limit, files_processed, session, library)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id, name, None, new_user['tokens'], new_user['subscription_limit'], 0,
+            session_json, library_json
+        ))
+        conn.commit()
     
     return new_user
 
 def get_all_user_ids() -> List[int]:
     """يسترجع ID كل المستخدمين للبث."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users")
-    ids = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users")
+        ids = [row[0] for row in cursor.fetchall()]
     return ids
 
+def get_user_ids_after(after_id: int = 0, limit: int = 1000) -> List[int]:
+    """دفعة من IDs المستخدمين (تصاعدي) بعد `after_id` — keyset pagination للبث من غير تحميل كل الـ IDs."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+        ids = [row[0] for row in cursor.fetchall()]
+    return ids
+
+def count_users() -> int:
+    """عدد المستخدمين."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users")
+        count = cursor.fetchone()[0]
+    return count
+
+def bulk_increment_tokens(amount: int) -> int:
+    """يضيف `amount` توكنز لكل المستخدمين في أمر UPDATE واحد ويرجع عدد المستخدمين اللي اتحدثوا."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET tokens = COALESCE(tokens, 0) + ?", (amount,))
+        updated = cursor.rowcount
+        conn.commit()
+    _invalidate_user_rows()
+    return updated
+
+def increment_tokens(user_id: int, delta: int) -> Optional[dict]:
+    """يزود/ينقص توكنز مستخدم واحد في UPDATE ذري (من غير ما تنزل تحت الصفر) ويرجع المستخدم بعد التعديل."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        # الحساب جوه SQLite نفسه، فضغطتين ورا بعض (أو أدمنين في نفس الوقت) مفيش تحديث فيهم بيضيع
+        cursor.execute("UPDATE users SET tokens = MAX(0, COALESCE(tokens, 0) + ?) WHERE id = ?", (delta, user_id))
+        updated = cursor.rowcount
+        conn.commit()
+    _invalidate_user_rows(user_id)
+    return _get_user_from_db(user_id) if updated else None
+
+def credit_subscription(user_id: int, tokens: int, file_limit: int) -> Optional[dict]:
+    """يضيف توكنز وحد ملفات باقة لمستخدم في UPDATE ذري واحد ويرجع المستخدم بعد التعديل (أو None لو مش موجود)."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE users SET tokens = COALESCE(tokens, 0) + ?, "
+            "subscription_limit = COALESCE(subscription_limit, 0) + ? WHERE id = ?",
+            (tokens, file_limit, user_id),
+        )
+        updated = cursor.rowcount
+        conn.commit()
+    _invalidate_user_rows(user_id)
+    return _get_user_from_db(user_id) if updated else None
+
+def set_user_phone(user_id: int, name: str, phone_number: str) -> None:
+    """يحفظ رقم تليفون المستخدم بأمر UPDATE واحد؛ ولو المستخدم لسه مش متسجل بيتعمل الأول."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET phone_number = ? WHERE id = ?", (phone_number, user_id))
+        updated = cursor.rowcount
+        conn.commit()
+    _invalidate_user_rows(user_id)
+    if not updated:
+        user = ensure_user(user_id, name)
+        user['phone_number'] = phone_number
+        _update_user_in_db(user_id, user)
+
+def bulk_toggle_night_mode() -> int:
+    """يقلب session.night_mode لكل المستخدمين في أمر UPDATE واحد (JSON1) ويرجع عدد المستخدمين."""
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        UPDATE users SET session = json_set(
+            COALESCE(NULLIF(session, ''), '{}'), '$.night_mode',
+            json(CASE WHEN json_extract(COALESCE(NULLIF(session, ''), '{}'), '$.night_mode') THEN 'false' ELSE 'true' END)
+        )
+        """)
+        updated = cursor.rowcount
+        conn.commit()
+    _invalidate_user_rows()
+    return updated
+
 def get_settings() -> dict:
     """يقرأ إعدادات البوت من قاعدة البيانات."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT key, value FROM settings")
-    settings = {row[0]: row[1] for row in cursor.fetchall()}
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT key, value FROM settings")
+        settings = {row[0]: row[1] for row in cursor.fetchall()}
     settings.setdefault("force_sub_channel", None)
     return settings
 
 def save_settings(settings: dict):
     """يحفظ إعدادات البوت في قاعدة البيانات."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    for key, value in settings.items():
-        cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        for key, value in settings.items():
+            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+        conn.commit()
 
 def get_all_users_detailed() -> List[dict]:
     """Return list of users with basic info for admin listing."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, phone_number, tokens, files_processed FROM users ORDER BY id DESC")
-    users = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    with _connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, phone_number, tokens, files_processed FROM users ORDER BY id DESC")
+        users = [dict(row) for row in cursor.fetchall()]
+    return users
+
+
+def get_users_page(before_id: Optional[int] = None, after_id: Optional[int] = None, limit: int = 10) -> List[dict]:
+    """صفحة من قائمة المستخدمين (الأحدث أولاً) بـ keyset pagination على id بدل تحميل كل الجدول.
+
+    before_id: المستخدمين اللي بعد آخر صف ظاهر (الصفحة التالية).
+    after_id: المستخدمين اللي قبل أول صف ظاهر (الصفحة السابقة).
+    """
+    with _connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cols = "id, name, phone_number, tokens, files_processed"
+        if after_id is not None:
+            cursor.execute(f"SELECT {cols} FROM users WHERE id > ? ORDER BY id ASC LIMIT ?", (after_id, limit))
+            users = [dict(row) for row in reversed(cursor.fetchall())]
+        elif before_id is not None:
+            cursor.execute(f"SELECT {cols} FROM users WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit))
+            users = [dict(row) for row in cursor.fetchall()]
+        else:
+            cursor.execute(f"SELECT {cols} FROM users ORDER BY id DESC LIMIT ?", (limit,))
+            users = [dict(row) for row in cursor.fetchall()]
+    return users
+
+
+def get_top_users_by_files(n: int = 5) -> List[dict]:
+    """أكثر n مستخدمين معالجة للملفات (الترتيب عند التعادل: الأحدث أولاً زي get_all_users_detailed)."""
+    with _connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, name, files_processed FROM users ORDER BY COALESCE(files_processed, 0) DESC, id DESC LIMIT ?",
+            (n,),
+        )
+        users = [dict(row) for row in cursor.fetchall()]
     return users
 
 
@@ -172,12 +360,11 @@ def get_all_users() -> List[dict]:
 
 def get_all_users_with_session() -> List[dict]:
     """Return list of users with id and parsed session for broadcasting filters."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, session FROM users")
-    rows = cursor.fetchall()
-    conn.close()
+    with _connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, session FROM users")
+        rows = cursor.fetchall()
     users = []
     for row in rows:
         try:
@@ -189,16 +376,15 @@ def get_all_users_with_session() -> List[dict]:
 
 def find_user(query: str) -> Optional[dict]:
     """Find a user by ID or name (case-insensitive)."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    try:
-        uid = int(query)
-        cursor.execute("SELECT * FROM users WHERE id = ?", (uid,))
-    except ValueError:
-        cursor.execute("SELECT * FROM users WHERE LOWER(name) LIKE ?", (f"%{query.lower()}%",))
-    row = cursor.fetchone()
-    conn.close()
+    with _connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        try:
+            uid = int(query)
+            cursor.execute("SELECT * FROM users WHERE id = ?", (uid,))
+        except ValueError:
+            cursor.execute("SELECT * FROM users WHERE LOWER(name) LIKE ?", (f"%{query.lower()}%",))
+        row = cursor.fetchone()
     if not row:
         return None
     user = dict(row)
@@ -209,28 +395,25 @@ def find_user(query: str) -> Optional[dict]:
 
 def get_bot_stats() -> dict:
     """Compute simple bot stats: number of users and total files processed."""
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM users")
-    users = cursor.fetchone()[0]
-    cursor.execute("SELECT SUM(files_processed) FROM users")
-    files = cursor.fetchone()[0] or 0
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users")
+        users = cursor.fetchone()[0]
+        cursor.execute("SELECT SUM(files_processed) FROM users")
+        files = cursor.fetchone()[0] or 0
     return {"users": users, "summaries": files, "top_feature": "ملخصات"}
 
 
 def log_admin_action(action: str, details: str = "") -> None:
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO admin_logs (action, details) VALUES (?, ?)", (action, details))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO admin_logs (action, details) VALUES (?, ?)", (action, details))
+        conn.commit()
 
 
 def get_last_logs(limit: int = 10) -> List[str]:
-    conn = sqlite3.connect(config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT ts, action, details FROM admin_logs ORDER BY id DESC LIMIT ?", (limit,))
-    rows = cursor.fetchall()
-    conn.close()
+    with _connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT ts, action, details FROM admin_logs ORDER BY id DESC LIMIT ?", (limit,))
+        rows = cursor.fetchall()
     return [f"[{r[0]}] {r[1]} - {r[2]}" for r in rows]
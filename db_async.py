@@ -0,0 +1,78 @@
+# db_async.py
+"""نسخ async من دوال database.py للـ handlers.
+
+كل دالة بتشغّل نظيرتها المتزامنة في الـ thread pool الافتراضي عن طريق asyncio.to_thread،
+فقراءة/كتابة SQLite ما بتوقفش الـ event loop لباقي المستخدمين.
+الاتصالات جاية من الـ pool بتاع database._connection() (check_same_thread=False)،
+وكل اتصال بيتسلّم لـ worker thread واحد بس لحد ما يرجع الـ pool، فالتشغيل من أكتر من thread آمن.
+"""
+import asyncio
+import functools
+from typing import Optional
+
+import database
+
+
+def _threaded(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return wrapper
+
+
+get_user = _threaded(database._get_user_from_db)
+update_user = _threaded(database._update_user_in_db)
+ensure_user = _threaded(database.ensure_user)
+find_user = _threaded(database.find_user)
+get_all_user_ids = _threaded(database.get_all_user_ids)
+get_user_ids_after = _threaded(database.get_user_ids_after)
+count_users = _threaded(database.count_users)
+get_all_users = _threaded(database.get_all_users)
+get_all_users_detailed = _threaded(database.get_all_users_detailed)
+get_users_page = _threaded(database.get_users_page)
+get_top_users_by_files = _threaded(database.get_top_users_by_files)
+increment_tokens = _threaded(database.increment_tokens)
+credit_subscription = _threaded(database.credit_subscription)
+set_user_phone = _threaded(database.set_user_phone)
+bulk_increment_tokens = _threaded(database.bulk_increment_tokens)
+bulk_toggle_night_mode = _threaded(database.bulk_toggle_night_mode)
+get_bot_stats = _threaded(database.get_bot_stats)
+log_admin_action = _threaded(database.log_admin_action)
+get_last_logs = _threaded(database.get_last_logs)
+
+
+async def iter_user_id_chunks(chunk: int = 1000):
+    """Async generator over every user ID in batches of `chunk`; only one batch is in memory at a time."""
+    last_id = 0
+    while True:
+        ids = await get_user_ids_after(last_id, chunk)
+        if not ids:
+            return
+        yield ids
+        if len(ids) < chunk:
+            return
+        last_id = ids[-1]
+
+
+# --- إعدادات البوت: كاش في الذاكرة، بيتحدث مع كل save_settings ---
+# كل الكتابة بتعدي من save_settings هنا، فالكاش عمره ما يبقى قديم داخل نفس العملية
+_settings_cache: Optional[dict] = None
+_settings_lock = asyncio.Lock()
+
+
+async def cached_settings() -> dict:
+    """إعدادات البوت من الكاش (أول نداء بس بيقرأ من SQLite). بترجع نسخة، فالتعديل عليها آمن."""
+    global _settings_cache
+    if _settings_cache is None:
+        async with _settings_lock:
+            if _settings_cache is None:
+                _settings_cache = await asyncio.to_thread(database.get_settings)
+    return dict(_settings_cache)
+
+
+async def save_settings(settings: dict) -> None:
+    """يحفظ الإعدادات ويحدّث الكاش (INSERT OR REPLACE بيدمج المفاتيح، فالكاش بيدمجها برضه)."""
+    global _settings_cache
+    await asyncio.to_thread(database.save_settings, settings)
+    if _settings_cache is not None:
+        _settings_cache = {**_settings_cache, **settings}
@@ -1,28 +1,311 @@
 # file_generator.py
 from asyncio.log import logger
+import asyncio
+import functools
 import io
+import multiprocessing
+import os
 import re
-import uuid
-from typing import List, Tuple, Optional, Dict
-import weasyprint
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Optional, Dict, Union
 from datetime import datetime
 
 import config
+from file_generator_hot import (
+    _allow_basic_html,
+    _convert_lists,
+    _escape_html,
+    _escape_text,
+    _parse_sections,
+    _render_items,
+)
 
-def _escape_html(s: str) -> str:
-    """A minimal HTML escaper for content that will be placed inside tags."""
-    s = str(s or "")
-    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+# WeasyPrint pulls in pango/cairo/fontconfig; import it on the first render only
+_weasyprint = None
 
 
-def _allow_basic_html(s: str) -> str:
-    """Escape all HTML then re-allow a safe subset of tags."""
-    if not s:
-        return ""
-    esc = _escape_html(s)
-    # Allow handful of inline/block tags
-    esc = re.sub(r"&lt;(/?(?:b|strong|i|em|ul|ol|li|br|sup|sub|h3|h4|blockquote|span))&gt;", r"<\1>", esc)
-    return esc
+def _wp():
+    global _weasyprint
+    if _weasyprint is None:
+        import weasyprint
+        _weasyprint = weasyprint
+    return _weasyprint
+
+
+@functools.lru_cache(maxsize=None)
+def _font_config():
+    """Shared across renders so fonts loaded by one document are reused by the next."""
+    from weasyprint.text.fonts import FontConfiguration
+    return FontConfiguration()
+
+
+@functools.lru_cache(maxsize=64)
+def _fetch_remote(url: str) -> tuple:
+    result = _wp().default_url_fetcher(url)
+    data = result.get('string')
+    if data is None:
+        with result['file_obj'] as f:
+            data = f.read()
+    return data, result.get('mime_type'), result.get('encoding'), result.get('redirected_url')
+
+
+def _url_fetcher(url: str, *args, **kwargs) -> dict:
+    """Serve http(s) resources (the Google Fonts @imports and their font files) from memory after
+    the first fetch, so each render doesn't stall on the network. Failures aren't cached."""
+    if not url.startswith(('http://', 'https://')):
+        return _wp().default_url_fetcher(url, *args, **kwargs)
+    data, mime_type, encoding, redirected_url = _fetch_remote(url)
+    return {'string': data, 'mime_type': mime_type, 'encoding': encoding, 'redirected_url': redirected_url}
+
+
+_stylesheets: Dict[str, object] = {}
+
+
+def _stylesheet(css: str):
+    """Parse a module-level CSS constant once and reuse the stylesheet for every render.
+
+    A sheet whose @import/font fetch failed is built with the fallback fonts but not kept,
+    so the next render retries the network instead of pinning the fallback for good.
+    """
+    sheet = _stylesheets.get(css)
+    if sheet is not None:
+        return sheet
+    failed: List[str] = []
+
+    def fetcher(url: str, *args, **kwargs) -> dict:
+        try:
+            return _url_fetcher(url, *args, **kwargs)
+        except Exception:
+            failed.append(url)
+            raise
+
+    sheet = _wp().CSS(string=css, font_config=_font_config(), url_fetcher=fetcher)
+    if not failed:
+        _stylesheets[css] = sheet
+    return sheet
+
+
+_EXEC_SNAPSHOT_H2_RE = re.compile(r"<h2>\s*Executive Snapshot\s*</h2>", re.IGNORECASE)
+_EXEC_SNAPSHOT_TEXT_RE = re.compile(r"(?:^|\n)\s*Executive Snapshot\s*\n", re.IGNORECASE)
+_H2_OPEN_RE = re.compile(r"<h2>", re.IGNORECASE)
+_H2_LINE_RE = re.compile(r"\n\s*<h2>", re.IGNORECASE)
+_CONTENTS_HEADERS = frozenset({'contents', 'document contents', 'محتويات المستند', 'محتويات'})
+
+
+def _cut_sections(s: str, start_re: re.Pattern, stop_re: re.Pattern, replacement: str) -> str:
+    """Replace every span from a start_re match up to the next stop_re match (or end)."""
+    out: List[str] = []
+    pos = 0
+    while True:
+        m = start_re.search(s, pos)
+        if not m:
+            break
+        out.append(s[pos:m.start()])
+        out.append(replacement)
+        stop = stop_re.search(s, m.end())
+        pos = stop.start() if stop else len(s)
+    if not out:
+        return s
+    out.append(s[pos:])
+    return ''.join(out)
+
+
+def _remove_exec_snapshot(s: str) -> str:
+    # Remove <h2>Executive Snapshot</h2> ... until next <h2> or end
+    s = _cut_sections(s, _EXEC_SNAPSHOT_H2_RE, _H2_OPEN_RE, "")
+    # Also plain text heading
+    return _cut_sections(s, _EXEC_SNAPSHOT_TEXT_RE, _H2_LINE_RE, "\n")
+
+
+def _collapse_contents_block(s: str) -> str:
+    # Drop a bare "Contents" heading line together with the blank lines right after it
+    lines = s.split('\n')
+    last = len(lines) - 1
+    out: List[str] = []
+    dropping = False
+    for i, ln in enumerate(lines):
+        if i < last:
+            if ln.rstrip().lower() in _CONTENTS_HEADERS:
+                dropping = True
+                continue
+            if dropping and not ln.strip():
+                continue
+        dropping = False
+        out.append(ln)
+    return '\n'.join(out)
+
+
+# First characters of every construct _convert_markup rewrites (bullets, bold, emoji lists)
+_MARKER_CHARS = frozenset('*-•❓✅⚠💡📌🧠🔍🔎📈📚🧩🎯🚀📖🏥🔬📝📊🔄#🗂')
+_NUMBERED_LINE_RE = re.compile(r'^\s*\d+[\.)]\s+', re.MULTILINE)
+
+
+def _convert_markup(processed: str) -> str:
+    """Turn icon headings, Q&A lines, lists and Markdown bold into HTML."""
+    # Hard split: if a paragraph holds multiple "- " bullets inline, force them onto new lines
+    processed = re.sub(r"\s-\s(?=[^\n]*-\s)", "\n- ", processed)
+
+    # Helper: split semicolon‑separated ideas into multiple items
+    def _split_semicolon_items(s: str) -> list[str]:
+        parts = re.split(r"\s*[;؛]\s+", s.strip())
+        return [p for p in (part.strip() for part in parts) if p]
+    
+    # Universal Icon Heading Processor
+    def icon_heading_replacer(match):
+        icon = match.group(1).strip()
+        heading = match.group(2).strip()
+        content = match.group(3).strip()
+        return f'<p class="icon-heading" data-icon="{icon}">{heading}</p><div class="icon-content">{content}</div>'
+    
+    processed = re.sub(
+        r'^\s*[-•]?\s*([^\w\s"\'<>&])\s*\*\*(.*?)\*\*[:\s]?(.*)',
+        icon_heading_replacer,
+        processed,
+        flags=re.MULTILINE
+    )
+
+    # Q&A one‑liner splitter: "❓ question — ✅ answer" → two separate lines
+    def qa_splitter(match):
+        q = match.group(1).strip()
+        a = match.group(2).strip()
+        return f'<p><strong>❓ {q}</strong></p>\n<p>✅ {a}</p>'
+    processed = re.sub(r'^\s*❓\s*(.*?)\s*[—–-]\s*✅?\s*(.*?)\s*$', qa_splitter, processed, flags=re.MULTILINE)
+
+    # Standard List Processor (hyphen / dot)
+    def list_replacer(match):
+        items = match.group(0).strip().split('\n')
+        li_items_parts = []
+        for raw in items:
+            txt = raw.strip()[2:].strip()
+            if not txt:
+                continue
+            segments = _split_semicolon_items(txt)
+            if len(segments) <= 1:
+                li_items_parts.append(f'<li>{txt}</li>')
+            else:
+                # expand into multiple sibling items (one idea per line)
+                for seg in segments:
+                    li_items_parts.append(f'<li>{seg}</li>')
+        return f'<ul class="standard">{"".join(li_items_parts)}</ul>'
+
+    processed = re.sub(r'((?:^\s*[-•]\s+.*\s*)+)', list_replacer, processed, flags=re.MULTILINE)
+
+    # Numbered List Processor: lines like "1. ..." or "1) ..."
+    def num_list_replacer(match):
+        items = match.group(0).strip().split('\n')
+        li_items = []
+        for it in items:
+            it = it.strip()
+            it = re.sub(r'^\s*\d+[\.)]\s*', '', it)
+            if it:
+                segments = _split_semicolon_items(it)
+                if len(segments) <= 1:
+                    li_items.append(f'<li>{it}</li>')
+                else:
+                    li_items.extend([f'<li>{seg}</li>' for seg in segments])
+        return f'<ol>{"".join(li_items)}</ol>'
+
+    processed = re.sub(r'((?:^\s*\d+[\.)]\s+.*\s*)+)', num_list_replacer, processed, flags=re.MULTILINE)
+
+    # Emoji List Processor: consecutive lines starting with an emoji
+    EMOJI_RE = r'(?:✅|⚠️|💡|📌|🧠|🔍|🔎|📈|📚|🧩|🎯|🚀|📖|🏥|🔬|📝|📊|🔄|❓|#️⃣|🗂️)'
+    def emoji_list_replacer(match):
+        items = match.group(0).split('\n')
+        li_items = []
+        for it in items:
+            t = it.strip()
+            if not t:
+                continue
+            m = re.match(rf'^\s*{EMOJI_RE}\s*', t)
+            emoji_prefix = m.group(0).strip() if m else ''
+            body = t[len(m.group(0)):] if m else t
+            segments = _split_semicolon_items(body)
+            if len(segments) <= 1:
+                li_items.append(f'<li>{t}</li>')
+            else:
+                # replicate emoji for each split segment
+                for seg in segments:
+                    li_items.append(f'<li>{emoji_prefix} {seg}</li>')
+        return f'<ul class="emoji-list">{"".join(li_items)}</ul>'
+
+    processed = re.sub(rf'((?:^\s*{EMOJI_RE}\s+.*\s*)+)', emoji_list_replacer, processed, flags=re.MULTILINE)
+    
+    # Process any remaining Markdown bold
+    processed = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed)
+
+    return processed
+
+
+@functools.lru_cache(maxsize=256)
+def _format_text_to_html(text_chunk: str, is_bilingual_col: bool = False) -> str:
+    """
+    A universal text formatter that handles icon headings, lists, bold text, and paragraphs.
+    """
+    processed = text_chunk
+    # Plain paragraphs carry no markers at all and go straight to paragraph wrapping
+    if not _MARKER_CHARS.isdisjoint(processed) or _NUMBERED_LINE_RE.search(processed):
+        processed = _convert_markup(processed)
+
+    # Wrap remaining text blocks in <p> tags
+    # Exclude lines that have already been converted to HTML
+    if not is_bilingual_col:
+        lines = processed.split('\n')
+        final_lines = []
+        for line in lines:
+            if line.strip() and not line.strip().startswith('<'):
+                final_lines.append(f'<p>{line.strip()}</p>')
+            else:
+                final_lines.append(line)
+        processed = "\n".join(final_lines)
+
+    return processed.replace("<p><ul>", "<ul>").replace("</ul></p>", "</ul>")
+
+
+# Arabic section labels, with or without bold/emoji decoration:
+# "**✅ الخلاصة:**", "✅ الخلاصة:", "**التفاصيل:**", ...
+_ARB_LABEL_RE = re.compile(r"\*{0,2}\s*(?:(?:✅\s*)?(الخلاصة)|(?:🔍\s*)?(التفاصيل))\s*:\s*")
+_ARB_LABEL_HTML = {
+    'الخلاصة': '<p class="summary-title">✅ الخلاصة:</p>',
+    'التفاصيل': '<p class="details-title">🔍 التفاصيل:</p>',
+}
+
+
+def _style_arb_sections(s: str) -> str:
+    """Split the Arabic column on its summary/details labels and emit styled paragraphs."""
+    parts = _ARB_LABEL_RE.split(s or "")
+    out: List[str] = []
+    head = parts[0]
+    if head.lstrip().startswith('<'):
+        out.append(head)
+    elif head.strip():
+        out.append(f"<p>{head}</p>")
+    # split() yields (summary, details, text) triples after the head
+    for i in range(1, len(parts), 3):
+        out.append(_ARB_LABEL_HTML[parts[i] or parts[i + 1]])
+        text = parts[i + 2]
+        if text.strip():
+            out.append(f"<p>{text}</p>")
+    return ''.join(out)
+
+
+# Static page skeleton for the premium template; only the placeholders change per call.
+_PREMIUM_HTML_TEMPLATE = """
+    <!doctype html>
+    <html>
+        <head>
+            <meta charset="utf-8"><title>{title}</title><style>{css}</style>
+        </head>
+        <body>
+            <div class="cover-page">
+                <h1 class="cover-title">{title}</h1>
+                <p class="cover-meta">Generated by @{author}<br/>{generated_on}</p>
+            </div>
+            <div class="main-content {lang_class}">
+                {body}
+            </div>
+        </body>
+    </html>"""
 
 def build_pdf_from_lines_weasy(
     title: str,
@@ -184,117 +467,6 @@ def build_pdf_from_lines_weasy(
     .main-content.ltr blockquote { border-right: none; border-left: 4px solid var(--primary-color); }
     """
     
-    def _format_text_to_html(text_chunk: str, is_bilingual_col: bool = False) -> str:
-        """
-        A universal text formatter that handles icon headings, lists, bold text, and paragraphs.
-        """
-        processed = text_chunk
-        # Hard split: if a paragraph holds multiple "- " bullets inline, force them onto new lines
-        processed = re.sub(r"\s-\s(?=[^\n]*-\s)", "\n- ", processed)
-
-        # Helper: split semicolon‑separated ideas into multiple items
-        def _split_semicolon_items(s: str) -> list[str]:
-            parts = re.split(r"\s*[;؛]\s+", s.strip())
-            return [p for p in (part.strip() for part in parts) if p]
-        
-        # Universal Icon Heading Processor
-        def icon_heading_replacer(match):
-            icon = match.group(1).strip()
-            heading = match.group(2).strip()
-            content = match.group(3).strip()
-            return f'<p class="icon-heading" data-icon="{icon}">{heading}</p><div class="icon-content">{content}</div>'
-        
-        processed = re.sub(
-            r'^\s*[-•]?\s*([^\w\s"\'<>&])\s*\*\*(.*?)\*\*[:\s]?(.*)',
-            icon_heading_replacer,
-            processed,
-            flags=re.MULTILINE
-        )
-
-        # Q&A one‑liner splitter: "❓ question — ✅ answer" → two separate lines
-        def qa_splitter(match):
-            q = match.group(1).strip()
-            a = match.group(2).strip()
-            return f'<p><strong>❓ {q}</strong></p>\n<p>✅ {a}</p>'
-        processed = re.sub(r'^\s*❓\s*(.*?)\s*[—–-]\s*✅?\s*(.*?)\s*$', qa_splitter, processed, flags=re.MULTILINE)
-
-        # Standard List Processor (hyphen / dot)
-        def list_replacer(match):
-            items = match.group(0).strip().split('\n')
-            li_items_parts = []
-            for raw in items:
-                txt = raw.strip()[2:].strip()
-                if not txt:
-                    continue
-                segments = _split_semicolon_items(txt)
-                if len(segments) <= 1:
-                    li_items_parts.append(f'<li>{txt}</li>')
-                else:
-                    # expand into multiple sibling items (one idea per line)
-                    for seg in segments:
-                        li_items_parts.append(f'<li>{seg}</li>')
-            return f'<ul class="standard">{"".join(li_items_parts)}</ul>'
-
-        processed = re.sub(r'((?:^\s*[-•]\s+.*\s*)+)', list_replacer, processed, flags=re.MULTILINE)
-
-        # Numbered List Processor: lines like "1. ..." or "1) ..."
-        def num_list_replacer(match):
-            items = match.group(0).strip().split('\n')
-            li_items = []
-            for it in items:
-                it = it.strip()
-                it = re.sub(r'^\s*\d+[\.)]\s*', '', it)
-                if it:
-                    segments = _split_semicolon_items(it)
-                    if len(segments) <= 1:
-                        li_items.append(f'<li>{it}</li>')
-                    else:
-                        li_items.extend([f'<li>{seg}</li>' for seg in segments])
-            return f'<ol>{"".join(li_items)}</ol>'
-
-        processed = re.sub(r'((?:^\s*\d+[\.)]\s+.*\s*)+)', num_list_replacer, processed, flags=re.MULTILINE)
-
-        # Emoji List Processor: consecutive lines starting with an emoji
-        EMOJI_RE = r'(?:✅|⚠️|💡|📌|🧠|🔍|🔎|📈|📚|🧩|🎯|🚀|📖|🏥|🔬|📝|📊|🔄|❓|#️⃣|🗂️)'
-        def emoji_list_replacer(match):
-            items = match.group(0).split('\n')
-            li_items = []
-            for it in items:
-                t = it.strip()
-                if not t:
-                    continue
-                m = re.match(rf'^\s*{EMOJI_RE}\s*', t)
-                emoji_prefix = m.group(0).strip() if m else ''
-                body = t[len(m.group(0)):] if m else t
-                segments = _split_semicolon_items(body)
-                if len(segments) <= 1:
-                    li_items.append(f'<li>{t}</li>')
-                else:
-                    # replicate emoji for each split segment
-                    for seg in segments:
-                        li_items.append(f'<li>{emoji_prefix} {seg}</li>')
-            return f'<ul class="emoji-list">{"".join(li_items)}</ul>'
-
-        processed = re.sub(rf'((?:^\s*{EMOJI_RE}\s+.*\s*)+)', emoji_list_replacer, processed, flags=re.MULTILINE)
-        
-        # Process any remaining Markdown bold
-        processed = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed)
-
-        # Wrap remaining text blocks in <p> tags
-        # Exclude lines that have already been converted to HTML
-        if not is_bilingual_col:
-            lines = processed.split('\n')
-            final_lines = []
-            for line in lines:
-                if line.strip() and not line.strip().startswith('<'):
-                    final_lines.append(f'<p>{line.strip()}</p>')
-                else:
-                    final_lines.append(line)
-            processed = "\n".join(final_lines)
-
-        return processed.replace("<p><ul>", "<ul>").replace("</ul></p>", "</ul>")
-
-
     def process_content_to_html(raw_content: str) -> str:
         # Pre-normalization helpers for English-only summaries
         def _explode_inline_bullets_text(s: str) -> str:
@@ -306,38 +478,6 @@ def build_pdf_from_lines_weasy(
             s = re.sub(r"([\.!?،؛])\s-\s+", r"\1\n- ", s)
             return s
 
-        def _remove_exec_snapshot(s: str) -> str:
-            # Remove <h2>Executive Snapshot</h2> ... until next <h2> or end
-            s = re.sub(r"<h2>\s*Executive Snapshot\s*</h2>.*?(?=<h2>|\Z)", "", s, flags=re.DOTALL | re.IGNORECASE)
-            # Also plain text heading
-            s = re.sub(r"(?:^|\n)\s*Executive Snapshot\s*\n.*?(?=(?:\n\s*<h2>)|\Z)", "\n", s, flags=re.DOTALL | re.IGNORECASE)
-            return s
-
-        def _collapse_contents_block(s: str) -> str:
-            # Match Contents/Document Contents/Arabic and capture following non-heading lines
-            def repl(m):
-                block = m.group(0)
-                header = m.group('hdr')
-                body = m.group('body')
-                # take non-empty lines that are not h2
-                items = []
-                for ln in body.splitlines():
-                    t = ln.strip().strip('-•')
-                    if not t:
-                        continue
-                    if t.lower().startswith('executive snapshot'):
-                        continue
-                    if t.startswith('<h2>'):
-                        break
-                    items.append(t)
-                if not items:
-                    return ''
-                enum = ' · '.join(f"{i+1}) {it}" for i, it in enumerate(items))
-                return enum + "\n"
-
-            pat = re.compile(r"(?P<hdr>^(?:Contents|Document Contents|محتويات المستند|محتويات)\s*$)\n(?P<body>(?:.(?!^<h2>))*?)", re.MULTILINE | re.DOTALL | re.IGNORECASE)
-            return pat.sub(repl, s)
-
         # Apply pre-normalization for messy paragraphs
         base_content = raw_content.replace('└─', '').replace('├─', '').replace('│', '')
         base_content = _explode_inline_bullets_text(base_content)
@@ -348,25 +488,7 @@ def build_pdf_from_lines_weasy(
             eng_text = match.group(1).strip()
             arb_text = match.group(2).strip()
 
-            # ✨ Improved: Robustly detect and style Arabic section labels even with emojis/bold
-            # Matches forms like: "**✅ الخلاصة:**", "✅ الخلاصة:", "**التفاصيل:**", etc.
-            def style_arb_sections(s: str) -> str:
-                s = s or ""
-                # Add an opening <p> if not already HTML
-                if not re.match(r"\s*<", s):
-                    s = "<p>" + s
-                # Summary
-                s = re.sub(r"\*{0,2}\s*(?:✅\s*)?الخلاصة\s*:\s*", '<p class="summary-title">✅ الخلاصة:</p><p>', s, flags=re.IGNORECASE)
-                # Details
-                s = re.sub(r"\*{0,2}\s*(?:🔍\s*)?التفاصيل\s*:\s*", '</p><p class="details-title">🔍 التفاصيل:</p><p>', s, flags=re.IGNORECASE)
-                # Ensure a closing paragraph
-                if not s.strip().endswith("</p>"):
-                    s += "</p>"
-                # Clean empty paragraphs
-                s = re.sub(r"<p>\s*</p>", "", s)
-                return s
-
-            arb_html = style_arb_sections(arb_text)
+            arb_html = _style_arb_sections(arb_text)
 
             # Format the English text simply, wrapping in paragraphs
             eng_html = "\n".join([f'<p>{line.strip()}</p>' for line in eng_text.split('\n') if line.strip()])
@@ -428,32 +550,73 @@ def build_pdf_from_lines_weasy(
     html_body = process_content_to_html(full_text_content)
     lang_class = "ltr" if lang == 'en' else ""
     
-    final_html = f"""
-    <!doctype html>
-    <html>
-        <head>
-            <meta charset="utf-8"><title>{_escape_html(main_title)}</title><style>{final_css}</style>
-        </head>
-        <body>
-            <div class="cover-page">
-                <h1 class="cover-title">{_escape_html(main_title)}</h1>
-                <p class="cover-meta">Generated by @{author_username}<br/>{datetime.now().strftime('%Y-%m-%d')}</p>
-            </div>
-            <div class="main-content {lang_class}">
-                {html_body}
-            </div>
-        </body>
-    </html>"""
+    safe_title = _escape_html(main_title)
+    final_html = _PREMIUM_HTML_TEMPLATE.format(
+        title=safe_title,
+        css=final_css,
+        author=author_username,
+        generated_on=datetime.now().strftime('%Y-%m-%d'),
+        lang_class=lang_class,
+        body=html_body,
+    )
     
     try:
-        pdf_bytes = weasyprint.HTML(string=final_html).write_pdf()
-        return io.BytesIO(pdf_bytes), f"premium_document_{uuid.uuid4().hex[:8]}.pdf"
+        bio = io.BytesIO()
+        _wp().HTML(string=final_html, url_fetcher=_url_fetcher).write_pdf(target=bio, font_config=_font_config())
+        bio.seek(0)
+        return bio, f"premium_document_{os.urandom(4).hex()}.pdf"
     except Exception as e:
         logger.error(f"PREMIUM PDF FAILED: {e}", exc_info=True)
         escaped_text = _escape_html(full_text_content)
-        minimal_html = f"<html><body><h1>{_escape_html(main_title)}</h1><pre>{escaped_text}</pre></body></html>"
-        pdf_bytes = weasyprint.HTML(string=minimal_html).write_pdf()
-    return io.BytesIO(pdf_bytes), f"fallback_document.pdf"
+        minimal_html = f"<html><body><h1>{safe_title}</h1><pre>{escaped_text}</pre></body></html>"
+        bio = io.BytesIO()
+        _wp().HTML(string=minimal_html).write_pdf(target=bio, font_config=_font_config())
+        bio.seek(0)
+        return bio, f"fallback_document_{os.urandom(4).hex()}.pdf"
+
+
+# --- WeasyPrint worker processes ---
+_PDF_POOL_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _pdf_worker_init() -> None:
+    """Warm up WeasyPrint (fontconfig, pango) once per worker process.
+
+    The shared FontConfiguration and every template stylesheet are built here too, so the
+    first job a worker picks up renders as fast as the ones after it.
+    """
+    for css in _TEMPLATE_CSS.values():
+        _stylesheet(css)
+    _wp().HTML(string="<p></p>").write_pdf(font_config=_font_config())
+
+
+def start_pdf_pool() -> None:
+    """Create the worker pool and start warming its workers (call from the app's post_init)."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        return
+    # spawn مش fork: البوت multithreaded (event loop + to_thread) والـ fork بيورّث locks ماسكها threads تانية
+    _pdf_pool = ProcessPoolExecutor(
+        max_workers=_PDF_POOL_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_pdf_worker_init,
+    )
+    # كل submit والـ workers لسه مشغولين بيولّد worker جديد، فالتسخين يخلص قبل أول طلب بدل جواه
+    for _ in range(_PDF_POOL_WORKERS):
+        _pdf_pool.submit(int)
+
+
+def stop_pdf_pool() -> None:
+    """Shut the worker pool down (call from the app's post_shutdown)."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=True, cancel_futures=True)
+        _pdf_pool = None
+
+
+_BULLET_PREFIXES = ('- ', '•', '▪', '–', '—', '*', '❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌')
+_WORD_RE = re.compile(r"[\w\u0600-\u06FF']+")
 
 
 def build_text_to_pdf(
@@ -470,19 +633,14 @@ def build_text_to_pdf(
     if not any(ln.strip() for ln in clean_lines):
         clean_lines = ["No content provided."]
 
-    word_count = sum(len(re.findall(r"[\w\u0600-\u06FF']+", ln)) for ln in clean_lines)
-    bullet_count = sum(1 for ln in clean_lines if ln.strip().startswith(('- ', '•', '▪', '–', '—', '*', '❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌')))
-    paragraph_count = max(1, sum(1 for ln in clean_lines if ln.strip() and not ln.strip().startswith(('- ', '•', '▪', '–', '—', '*', '❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌'))))
-
-    def _seg_type(line: str) -> str:
-        stripped = line.strip()
+    def _seg_type(stripped: str) -> str:
         if not stripped:
             return 'blank'
         if stripped.startswith(('# ', '## ')):
             return 'heading'
         if stripped.startswith(('### ', '#### ')):
             return 'subheading'
-        if stripped.startswith(('- ', '•', '▪', '–', '—', '*', '❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌')):
+        if stripped.startswith(_BULLET_PREFIXES):
             return 'bullet'
         if stripped.endswith(':') and len(stripped) <= 60:
             return 'heading'
@@ -490,22 +648,29 @@ def build_text_to_pdf(
             return 'heading'
         return 'paragraph'
 
+    # Single pass: classify each line once and derive the counters from it
+    word_count = 0
+    bullet_count = 0
+    paragraph_count = 0
     blocks: List[dict] = []
     current_list: List[str] | None = None
     for raw in clean_lines:
-        kind = _seg_type(raw)
         text = raw.strip()
+        kind = _seg_type(text)
         if kind == 'blank':
             if current_list:
                 blocks.append({'type': 'list', 'items': current_list})
                 current_list = None
             continue
+        word_count += sum(1 for _ in _WORD_RE.finditer(text))
         if kind == 'bullet':
+            bullet_count += 1
             if current_list is None:
                 current_list = []
             marker_removed = re.sub(r"^[-•▪–—*\s]+", '', text, count=1).strip()
             current_list.append(marker_removed)
             continue
+        paragraph_count += 1
         if current_list:
             blocks.append({'type': 'list', 'items': current_list})
             current_list = None
@@ -519,6 +684,7 @@ def build_text_to_pdf(
             blocks.append({'type': 'paragraph', 'text': text})
     if current_list:
         blocks.append({'type': 'list', 'items': current_list})
+    paragraph_count = max(1, paragraph_count)
 
     heading_chips = [blk['text'] for blk in blocks if blk['type'] in {'heading', 'subheading'}][:5]
     if not heading_chips:
@@ -751,13 +917,104 @@ def build_text_to_pdf(
     </html>
     """
 
-    pdf_bytes = weasyprint.HTML(string=html).write_pdf()
-    bio = io.BytesIO(pdf_bytes)
-    bio.name = f"text_sheet_{uuid.uuid4().hex[:8]}.pdf"
+    bio = io.BytesIO()
+    _wp().HTML(string=html, url_fetcher=_url_fetcher).write_pdf(target=bio, font_config=_font_config())
+    bio.name = f"text_sheet_{os.urandom(4).hex()}.pdf"
     bio.seek(0)
     return bio, bio.name
 
 
+# --- Patterns used only by the study/translation builders (compiled once) ---
+_INLINE_TOC_RE = re.compile(r"^\d+\)\s")
+_TOC_SEP_RE = re.compile(r"\s·\s")
+_HEADING_RE = re.compile(r'<(h2|h3)>(.*?)</\1>', re.IGNORECASE | re.DOTALL)
+_ADV_ITEM_RE = re.compile(r'^(?:\d+[\.)]|[-•])\s*(.*)')
+_ADV_RE = re.compile(r'\s*(?:advantages|disadvantages|pros|cons)\b', re.IGNORECASE)
+
+
+_SUMMARY_V2_CSS = """
+@page { size: A4; margin: 1.8cm; }
+@import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&family=Cairo:wght@400;600;800&display=swap');
+body { font-family: 'Inter','Cairo',sans-serif; background: linear-gradient(135deg,#f8fafc,#eef2ff); color:#0f172a; }
+.wrap {
+    background: linear-gradient(180deg,#ffffff 0%,#f7f9ff 100%);
+    border-radius:24px;
+    padding:40px 44px;
+    border:1px solid rgba(148,163,184,0.22);
+}
+.cover { text-align:center; margin-bottom: 28px; }
+.cover h1 { font-size: 30pt; margin: 0 0 12px 0; color:#0b1120; letter-spacing:-0.01em; text-shadow:0 6px 14px rgba(15,23,42,0.25); }
+.cover .meta { color:#64748b; font-size:11pt; text-transform:uppercase; letter-spacing:0.14em; }
+.chips { margin: 16px 0 30px; display:flex; flex-wrap:wrap; gap:12px; justify-content:center; }
+.chip {
+    display:inline-flex; align-items:center; gap:8px;
+    background:rgba(59,130,246,0.18);
+    border:1px solid rgba(59,130,246,0.32);
+    color:#1d4ed8; padding:6px 16px;
+    border-radius:999px; font-weight:600;
+}
+.chip::before { content:'⬡'; font-size:10pt; color:#1d4ed8; }
+h2 { font-size: 19pt; margin: 34px 0 14px; color:#0f172a; display:flex; align-items:center; gap:12px; position:relative; padding-left:20px; text-transform:uppercase; letter-spacing:0.08em; }
+h2::before { content:'◆'; color:#3b82f6; font-size:16pt; position:absolute; left:0; text-shadow:0 4px 10px rgba(59,130,246,0.35); }
+p { margin: 0 0 14px 0; line-height:1.92; font-size:11.6pt; }
+ul { margin: 0 0 22px 0; padding-inline-start: 28px; }
+ul li { margin: 10px 0; font-size:11.5pt; line-height:1.88; }
+ul li::marker { color:#0ea5e9; font-size:0.9em; }
+.lead { color:#1f2937; font-size:11.9pt; font-weight:500; letter-spacing:0.012em; }
+.subheading { font-size:17pt; font-weight:700; color:#1d4ed8; margin:28px 0 16px; letter-spacing:0.035em; }
+.focus-line { display:block; font-weight:600; letter-spacing:0.01em; }
+.focus-line.focus-en { direction:ltr; text-align:left; font-family:'Inter','Cairo',sans-serif; }
+.focus-line.focus-ar { direction:rtl; text-align:right; font-family:'Cairo','Inter',sans-serif; }
+.qa {
+    background:linear-gradient(135deg,#f8fafc,#dbeafe);
+    border:1px solid rgba(59,130,246,0.28);
+    border-radius:18px; padding:20px 22px; margin:20px 0;
+}
+.qa .q { font-weight:700; color:#0f172a; margin:0 0 8px; font-size:12pt; }
+.qa .a { margin:0; color:#1f2937; font-size:11.5pt; line-height:1.9; }
+.flow { display:flex; flex-wrap:wrap; gap:14px; margin:22px 0; }
+.flow span {
+    background:linear-gradient(135deg,#fde68a,#f59e0b);
+    color:#92400e; padding:9px 20px;
+    border-radius:999px; font-weight:600; line-height:1.9;
+}
+.fact {
+    background:linear-gradient(135deg,#e0f2fe,#bae6fd);
+    border-left:6px solid #0369a1;
+    padding:16px 18px; margin:18px 0;
+    border-radius:18px;
+}
+.fact strong { color:#0e7490; letter-spacing:0.08em; }
+.divider { height:1px; background:linear-gradient(90deg,rgba(148,163,184,0),rgba(148,163,184,0.55),rgba(148,163,184,0)); margin:30px 0; }
+.em {
+    background:linear-gradient(135deg,#fee2e2,#fecaca);
+    padding:3px 10px; border-radius:10px;
+    font-weight:700; color:#991b1b;
+}
+.hl-term {
+    background:linear-gradient(135deg,#dbeafe,#bfdbfe);
+    color:#1d4ed8; padding:4px 12px;
+    border-radius:12px; font-weight:700;
+    display:inline-block; margin-right:8px;
+}
+.hl-math {
+    background:linear-gradient(135deg,#ede9fe,#ddd6fe);
+    color:#5b21b6; padding:3px 10px;
+    border-radius:10px; font-weight:700;
+}
+blockquote.deep-quote {
+    margin: 22px 0;
+    padding: 20px 24px;
+    background:linear-gradient(135deg,#fef3c7,#fde68a);
+    border-radius:18px;
+    border:1px solid rgba(234,179,8,0.45);
+    color:#7c2d12;
+    font-style:italic;
+    line-height:2.0;
+}
+"""
+
+
 def build_summary_pdf_v2(
     title: str,
     author_username: str,
@@ -773,93 +1030,11 @@ def build_summary_pdf_v2(
     """
     content = "\n".join(lines or [])
 
-    css = """
-    @page { size: A4; margin: 1.8cm; }
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&family=Cairo:wght@400;600;800&display=swap');
-    body { font-family: 'Inter','Cairo',sans-serif; background: linear-gradient(135deg,#f8fafc,#eef2ff); color:#0f172a; }
-    .wrap {
-        background: linear-gradient(180deg,#ffffff 0%,#f7f9ff 100%);
-        border-radius:24px;
-        padding:40px 44px;
-        border:1px solid rgba(148,163,184,0.22);
-    }
-    .cover { text-align:center; margin-bottom: 28px; }
-    .cover h1 { font-size: 30pt; margin: 0 0 12px 0; color:#0b1120; letter-spacing:-0.01em; text-shadow:0 6px 14px rgba(15,23,42,0.25); }
-    .cover .meta { color:#64748b; font-size:11pt; text-transform:uppercase; letter-spacing:0.14em; }
-    .chips { margin: 16px 0 30px; display:flex; flex-wrap:wrap; gap:12px; justify-content:center; }
-    .chip {
-        display:inline-flex; align-items:center; gap:8px;
-        background:rgba(59,130,246,0.18);
-        border:1px solid rgba(59,130,246,0.32);
-        color:#1d4ed8; padding:6px 16px;
-        border-radius:999px; font-weight:600;
-    }
-    .chip::before { content:'⬡'; font-size:10pt; color:#1d4ed8; }
-    h2 { font-size: 19pt; margin: 34px 0 14px; color:#0f172a; display:flex; align-items:center; gap:12px; position:relative; padding-left:20px; text-transform:uppercase; letter-spacing:0.08em; }
-    h2::before { content:'◆'; color:#3b82f6; font-size:16pt; position:absolute; left:0; text-shadow:0 4px 10px rgba(59,130,246,0.35); }
-    p { margin: 0 0 14px 0; line-height:1.92; font-size:11.6pt; }
-    ul { margin: 0 0 22px 0; padding-inline-start: 28px; }
-    ul li { margin: 10px 0; font-size:11.5pt; line-height:1.88; }
-    ul li::marker { color:#0ea5e9; font-size:0.9em; }
-    .lead { color:#1f2937; font-size:11.9pt; font-weight:500; letter-spacing:0.012em; }
-    .subheading { font-size:17pt; font-weight:700; color:#1d4ed8; margin:28px 0 16px; letter-spacing:0.035em; }
-    .focus-line { display:block; font-weight:600; letter-spacing:0.01em; }
-    .focus-line.focus-en { direction:ltr; text-align:left; font-family:'Inter','Cairo',sans-serif; }
-    .focus-line.focus-ar { direction:rtl; text-align:right; font-family:'Cairo','Inter',sans-serif; }
-    .qa {
-        background:linear-gradient(135deg,#f8fafc,#dbeafe);
-        border:1px solid rgba(59,130,246,0.28);
-        border-radius:18px; padding:20px 22px; margin:20px 0;
-    }
-    .qa .q { font-weight:700; color:#0f172a; margin:0 0 8px; font-size:12pt; }
-    .qa .a { margin:0; color:#1f2937; font-size:11.5pt; line-height:1.9; }
-    .flow { display:flex; flex-wrap:wrap; gap:14px; margin:22px 0; }
-    .flow span {
-        background:linear-gradient(135deg,#fde68a,#f59e0b);
-        color:#92400e; padding:9px 20px;
-        border-radius:999px; font-weight:600; line-height:1.9;
-    }
-    .fact {
-        background:linear-gradient(135deg,#e0f2fe,#bae6fd);
-        border-left:6px solid #0369a1;
-        padding:16px 18px; margin:18px 0;
-        border-radius:18px;
-    }
-    .fact strong { color:#0e7490; letter-spacing:0.08em; }
-    .divider { height:1px; background:linear-gradient(90deg,rgba(148,163,184,0),rgba(148,163,184,0.55),rgba(148,163,184,0)); margin:30px 0; }
-    .em {
-        background:linear-gradient(135deg,#fee2e2,#fecaca);
-        padding:3px 10px; border-radius:10px;
-        font-weight:700; color:#991b1b;
-    }
-    .hl-term {
-        background:linear-gradient(135deg,#dbeafe,#bfdbfe);
-        color:#1d4ed8; padding:4px 12px;
-        border-radius:12px; font-weight:700;
-        display:inline-block; margin-right:8px;
-    }
-    .hl-math {
-        background:linear-gradient(135deg,#ede9fe,#ddd6fe);
-        color:#5b21b6; padding:3px 10px;
-        border-radius:10px; font-weight:700;
-    }
-    blockquote.deep-quote {
-        margin: 22px 0;
-        padding: 20px 24px;
-        background:linear-gradient(135deg,#fef3c7,#fde68a);
-        border-radius:18px;
-        border:1px solid rgba(234,179,8,0.45);
-        color:#7c2d12;
-        font-style:italic;
-        line-height:2.0;
-    }
-    """
-
     # Detect a one-line inline TOC from the first few lines if present (already normalized by upstream)
     inline_toc = None
     for ln in lines[:8]:
         t = (ln or '').strip()
-        if t and re.match(r"^\d+\)\s", t):
+        if t and _INLINE_TOC_RE.match(t):
             inline_toc = t
             break
 
@@ -868,184 +1043,62 @@ def build_summary_pdf_v2(
     html_parts.append(f"<div class='cover'><h1>{_escape_html(title)}</h1><div class='meta'>by @{_escape_html(author_username)}</div></div>")
     if inline_toc:
         # Turn inline TOC into pill chips
-        items = [x.strip() for x in re.split(r"\s·\s", inline_toc) if x.strip()]
+        items = [x.strip() for x in _TOC_SEP_RE.split(inline_toc) if x.strip()]
         chips = ''.join(f"<span class='chip'>{_escape_html(it)}</span>" for it in items)
         html_parts.append(f"<div class='chips'>{chips}</div>")
 
-    SECTION_HEADINGS = {
-        'Complete Outline', 'Concepts & Definitions', 'Definitions', 'Key Facts & Numbers',
-        'Symbols & Notation', 'Formulas & Calculations', 'Processes & Steps',
-        'Examples & Analogies', 'Common Pitfalls', 'Q&A Checkpoints', 'Final Takeaway',
-        'المخطط الكامل', 'المفاهيم والتعاريف', 'التعريفات', 'حقائق وأرقام', 'الرموز والاصطلاحات',
-        'معادلات وحسابات', 'العمليات والخطوات', 'أمثلة وتشبيهات', 'مزالق شائعة',
-        'أسئلة ومراجعات', 'الخلاصة النهائية'
-    }
-
-    def parse_sections(lines: List[str]) -> List[Dict[str, List[str]]]:
-        sections: List[Dict[str, List[str]]] = []
-        current = {'title': None, 'items': []}
-        SKIP_TITLES = {'complete outline', 'المخطط الكامل'}
-        lower_titles = {h.lower() for h in SECTION_HEADINGS}
-        skipping = False
-        for ln in lines:
-            s = (ln or '').strip()
-            if not s:
-                continue
-            low = s.lower()
-            is_heading = (s in SECTION_HEADINGS) or (low in lower_titles) or re.match(r"^<h2>.*</h2>$", s, flags=re.IGNORECASE)
-            if is_heading:
-                title_text = re.sub(r"<.?h2>", "", s, flags=re.IGNORECASE)
-                title_text = title_text if title_text else s
-                if current['items'] and not skipping:
-                    sections.append(current)
-                skipping = title_text and title_text.lower() in SKIP_TITLES
-                current = {'title': title_text if not skipping else None, 'items': []}
-                continue
-            if skipping:
-                continue
-            current.setdefault('items', []).append(s)
-        if current['items'] and not skipping:
-            sections.append(current)
-        return [sec for sec in sections if sec.get('title')]
-
-    HIGHLIGHT_PHRASES = [
-        'Prevalence Rate', 'Incidence Rate', 'Prevalence Ratio', 'Prevalence Odds Ratio',
-        'Cross-sectional study', 'Case-control study', 'Cohort study',
-        'Confidence Interval', 'Temporal relationship', 'Risk factor',
-        'Public health planning', 'Hypothesis generation'
-    ]
-    HIGHLIGHT_WORDS = [
-        'Prevalence', 'Incidence', 'Odds Ratio', 'Risk', 'Cross-sectional',
-        'Study', 'Case-control', 'Cohort', 'Exposure', 'Outcome',
-        'Rate', 'Ratio', 'Duration', 'Etiology', 'Bias', 'Sensitivity',
-        'Specificity', 'Hypothesis', 'Causality', 'Temporal', 'Distribution'
-    ]
-    WORD_PATTERN = re.compile(r'\b(' + '|'.join(re.escape(w) for w in HIGHLIGHT_WORDS) + r')\b', flags=re.IGNORECASE)
-    PHRASE_PATTERNS = [re.compile(re.escape(p), flags=re.IGNORECASE) for p in sorted(HIGHLIGHT_PHRASES, key=len, reverse=True)]
-    EQUATION_PATTERN = re.compile(r'([A-Za-z][A-Za-z\s]{0,12}=\s*[^<\n]+)')
-
-    def _highlight_terms_html(html_text: str) -> str:
-        if not html_text:
-            return html_text
-        parts = re.split(r'(<[^>]+>)', html_text)
-        for idx, part in enumerate(parts):
-            if not part or part.startswith('<'):
-                continue
-            text = part
-            placeholders = []
-            token_counter = 0
-            for pattern in PHRASE_PATTERNS:
-                def repl(match):
-                    nonlocal token_counter
-                    token = f"@@PHRASE{token_counter}@@"
-                    placeholders.append((token, match.group(0)))
-                    token_counter += 1
-                    return token
-                text = pattern.sub(repl, text)
-            text = WORD_PATTERN.sub(lambda m: f"<span class='em'>{m.group(0)}</span>", text)
-            for token, original in placeholders:
-                text = text.replace(token, f"<span class='hl-term'>{original}</span>")
-            parts[idx] = text
-        return ''.join(parts)
-
-    def _highlight_equations_html(html_text: str) -> str:
-        if not html_text:
-            return html_text
-        parts = re.split(r'(<[^>]+>)', html_text)
-        for idx, part in enumerate(parts):
-            if not part or part.startswith('<'):
-                continue
-            parts[idx] = EQUATION_PATTERN.sub(lambda m: f"<span class='hl-math'>{m.group(0).strip()}</span>", part)
-        return ''.join(parts)
-
-    def _format_segment(raw: str, *, prefix: str | None = None) -> str:
-        txt = _allow_basic_html(raw or '')
-        if prefix and not txt.strip().startswith(prefix):
-            txt = f"{prefix} {txt.strip()}"
-        txt = _highlight_terms_html(txt)
-        txt = _highlight_equations_html(txt)
-        return txt
-
-    def render_items(items: List[str]) -> str:
-        out: List[str] = []
-        i = 0
-        n = len(items)
-        while i < n:
-            raw = items[i]
-            s = raw.strip()
-            # Subheadings
-            if re.match(r"^<h3>.*</h3>$", s, flags=re.IGNORECASE):
-                sub = re.sub(r"</?h3>", "", s, flags=re.IGNORECASE).strip()
-                out.append(f"<div class='subheading'>{_escape_html(sub)}</div>")
-                i += 1
-                continue
-            # Blockquotes / insights
-            if re.match(r"^<blockquote>.*</blockquote>$", s, flags=re.IGNORECASE):
-                inner = re.sub(r"</?blockquote>", "", s, flags=re.IGNORECASE)
-                out.append(f"<blockquote class='deep-quote'>{_format_segment(inner)}</blockquote>")
-                i += 1
-                continue
-            # Lists (emoji / hyphen / numbered)
-            if re.match(r"^[\d\u0660-\u0669]+[\.)\-]?\s+", s) or re.match(r"^(?:[-•–—▪︎·])\s+", s) or re.match(r"^[📚📖🧠💡📌📝📊✅⚠️🔎🔍🚀🎯🧩]", s):
-                bullets = []
-                while i < n:
-                    cur = items[i].strip()
-                    if not (re.match(r"^[\d\u0660-\u0669]+[\.)\-]?\s+", cur) or re.match(r"^(?:[-•–—▪︎·])\s+", cur) or re.match(r"^[📚📖🧠💡📌📝📊✅⚠️🔎🔍🚀🎯🧩]", cur)):
-                        break
-                    entry = re.sub(r"^[\d\u0660-\u0669]+[\.)\-]?\s+", '', cur)
-                    entry = re.sub(r"^(?:[-•–—▪︎·])\s+", '', entry)
-                    if not re.match(r"^[📚📖🧠💡📌📝📊✅⚠️🔎🔍🚀🎯🧩#]", entry):
-                        entry = f"📚 {entry}"
-                    bullets.append(_format_segment(entry))
-                    i += 1
-                out.append('<ul>' + ''.join(f"<li>{x}</li>" for x in bullets) + '</ul>')
-                continue
-            # Q&A blocks
-            if s.startswith('❓'):
-                question = s
-                answer = ''
-                if i + 1 < n and items[i+1].strip().startswith('✅'):
-                    answer = items[i+1].strip()
-                    i += 1
-                out.append(
-                    "<div class='qa'>"
-                    f"<p class='q'>{_format_segment(question)}</p>"
-                    f"<p class='a'>{_format_segment(answer)}</p>"
-                    "</div>"
-                )
-                i += 1
-                continue
-            # Process flow (arrows)
-            if '→' in s or '->' in s:
-                steps = [seg.strip() for seg in re.split(r"→|->", s) if seg.strip()]
-                out.append("<div class='flow'>" + ''.join(f"<span>{_format_segment(step)}</span>" for step in steps) + "</div>")
-                i += 1
-                continue
-            # Fact boxes (# ...)
-            if s.startswith('#'):
-                fact = s.lstrip('#').strip()
-                out.append(f"<div class='fact'><strong>FACT</strong> {_format_segment(fact)}</div>")
-                i += 1
-                continue
-            out.append(f"<p class='lead'>{_format_segment(s)}</p>")
-            i += 1
-        return ''.join(out)
-
-    sections = parse_sections(lines)
+    sections = _parse_sections(lines)
     for idx, section in enumerate(sections):
         title = section.get('title')
         if title:
             html_parts.append(f"<h2>{_escape_html(title)}</h2>")
-        html_parts.append(render_items(section.get('items', [])))
+        html_parts.append(_render_items(section.get('items', [])))
         if idx != len(sections) - 1:
             html_parts.append("<div class='divider'></div>")
 
-    html = f"<!doctype html><html><head><meta charset='utf-8'><style>{css}</style></head><body><div class='wrap'>{''.join(html_parts)}</div></body></html>"
-    pdf = weasyprint.HTML(string=html).write_pdf()
-    bio = io.BytesIO(pdf)
-    bio.name = f"summary_v2_{uuid.uuid4().hex[:8]}.pdf"
-    bio.seek(0)
-    return bio, bio.name
+    html = f"<!doctype html><html><head><meta charset='utf-8'></head><body><div class='wrap'>{''.join(html_parts)}</div></body></html>"
+    return _render_named(html, 'summary_v2', 'summary_v2')
+
+
+_STUDY_PRO_CSS = """
+@import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;800&family=Roboto:wght@400;500;700&display=swap');
+@page { size: A4; margin: 2cm; }
+body { font-family: 'Cairo','Roboto',sans-serif; color:#2f3542; }
+.cover { page: cover; height: 100%; display:flex; align-items:center; justify-content:center; flex-direction:column; background:#0f3460; color:#fff; }
+.cover h1 { font-size: 34pt; margin:0 0 10px 0; }
+.cover .meta { opacity:.9; }
+.toc { page: toc; }
+.toc h2 { color:#0f3460; border-bottom:2px solid #0f3460; padding-bottom:8px; }
+.toc ul { list-style: none; padding:0; margin:0; }
+.toc li { margin:10px 0; }
+.toc ul.sub { margin:6px 0 0 14px; }
+.toc a { color:#1e90ff; text-decoration:none; }
+.toc a:hover { text-decoration:underline; }
+h1, h2, h3 { color:#0f3460; }
+.content h2 { border-bottom:1px solid #dfe6e9; padding-bottom:6px; margin-top:24px; }
+.content h3 { margin-top:18px; }
+.backlink { margin:6px 0 10px; font-size: 10pt; }
+.backlink.small { font-size: 9pt; }
+"""
+
+
+def _number_heading(
+    h2_list: List[Tuple[int, str]],
+    h3_map: Dict[int, List[Tuple[int, str]]],
+    m: "re.Match[str]",
+) -> str:
+    """_HEADING_RE callback: record the heading for the ToC and return it with an id (H3 also gets a back link)."""
+    text = (m.group(2) or '').strip()
+    if m.group(1).lower() == 'h2':
+        idx = len(h2_list) + 1
+        h2_list.append((idx, text))
+        return f'<h2 id="sec2_{idx}">{text}</h2>'
+    # H3 hangs under the latest H2 (0 before the first one)
+    h2_idx = len(h2_list)
+    subs = h3_map.setdefault(h2_idx, [])
+    sub_idx = len(subs) + 1
+    subs.append((sub_idx, text))
+    return f'<h3 id="sec3_{h2_idx}_{sub_idx}">{text}</h3>\n<p class=\'backlink small\'><a href=\'#toc\'>⬆︎ رجوع للفهرس</a></p>'
 
 
 def build_study_pro_pdf(
@@ -1060,77 +1113,21 @@ def build_study_pro_pdf(
     h2_list: list[tuple[int, str]] = []
     h3_map: dict[int, list[tuple[int, str]]] = {}
 
-    # Assign IDs to H2
-    def _assign_h2_id(match):
-        idx = len(h2_list) + 1
-        text = (match.group(1) or '').strip()
-        h2_list.append((idx, text))
-        return f'<h2 id="sec2_{idx}">{text}</h2>'
-
-    content = re.sub(r'<h2>(.*?)</h2>', _assign_h2_id, content, flags=re.IGNORECASE | re.DOTALL)
-
-    # For each H3, attach under the latest H2
-    current_h2_idx = 0
-    parts = re.split(r'(<h2 id="sec2_\d+">.*?</h2>)', content, flags=re.IGNORECASE | re.DOTALL)
-    rebuilt: list[str] = []
-    for part in parts:
-        if not part:
-            continue
-        m2 = re.search(r'<h2 id="sec2_(\d+)">', part)
-        if m2:
-            current_h2_idx = int(m2.group(1))
-            rebuilt.append(part)
-            continue
-
-        # Replace H3 inside this block, collecting ToC entries
-        def _assign_h3_id(m):
-            h3_map.setdefault(current_h2_idx, [])
-            sub_idx = len(h3_map[current_h2_idx]) + 1
-            text = (m.group(1) or '').strip()
-            h3_map[current_h2_idx].append((sub_idx, text))
-            return f'<h3 id="sec3_{current_h2_idx}_{sub_idx}">{text}</h3>'
-
-        part = re.sub(r'<h3>(.*?)</h3>', _assign_h3_id, part, flags=re.IGNORECASE | re.DOTALL)
-
-        # Inject a back‑to‑toc link after H2/H3 headings
-        part = re.sub(r'(</h2>)', r"\1\n<p class='backlink'><a href='#toc'>⬆︎ رجوع للفهرس</a></p>", part)
-        part = re.sub(r'(</h3>)', r"\1\n<p class='backlink small'><a href='#toc'>⬆︎ رجوع للفهرس</a></p>", part)
-        rebuilt.append(part)
-
-    content_with_ids = ''.join(rebuilt) if rebuilt else content
+    # One scan: number H2/H3 headings (H3 hangs under the latest H2) and add a back‑to‑toc link after each
+    content_with_ids = _HEADING_RE.sub(functools.partial(_number_heading, h2_list, h3_map), content)
 
     # Build nested ToC
-    toc_items = []
+    toc_items: List[str] = []
     for idx, text in h2_list:
-        sub_items = ''.join(
-            f"<li><a href='#sec3_{idx}_{sub}'>· {_escape_html(txt)}</a></li>"
-            for sub, txt in h3_map.get(idx, [])
-        )
-        sub_html = f"<ul class='sub'>{sub_items}</ul>" if sub_items else ""
-        toc_items.append(f"<li><a href='#sec2_{idx}'>{_escape_html(text)}</a>{sub_html}</li>")
+        toc_items.append(f"<li><a href='#sec2_{idx}'>{_escape_html(text)}</a>")
+        subs = h3_map.get(idx)
+        if subs:
+            toc_items.append("<ul class='sub'>")
+            toc_items.extend(f"<li><a href='#sec3_{idx}_{sub}'>· {_escape_html(txt)}</a></li>" for sub, txt in subs)
+            toc_items.append("</ul>")
+        toc_items.append("</li>")
     toc_html_list = ''.join(toc_items) or '<li>—</li>'
 
-    css = """
-    @import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;800&family=Roboto:wght@400;500;700&display=swap');
-    @page { size: A4; margin: 2cm; }
-    body { font-family: 'Cairo','Roboto',sans-serif; color:#2f3542; }
-    .cover { page: cover; height: 100%; display:flex; align-items:center; justify-content:center; flex-direction:column; background:#0f3460; color:#fff; }
-    .cover h1 { font-size: 34pt; margin:0 0 10px 0; }
-    .cover .meta { opacity:.9; }
-    .toc { page: toc; }
-    .toc h2 { color:#0f3460; border-bottom:2px solid #0f3460; padding-bottom:8px; }
-    .toc ul { list-style: none; padding:0; margin:0; }
-    .toc li { margin:10px 0; }
-    .toc ul.sub { margin:6px 0 0 14px; }
-    .toc a { color:#1e90ff; text-decoration:none; }
-    .toc a:hover { text-decoration:underline; }
-    h1, h2, h3 { color:#0f3460; }
-    .content h2 { border-bottom:1px solid #dfe6e9; padding-bottom:6px; margin-top:24px; }
-    .content h3 { margin-top:18px; }
-    .backlink { margin:6px 0 10px; font-size: 10pt; }
-    .backlink.small { font-size: 9pt; }
-    """
-
     cover_html = f"""
     <div class='cover'>
       <h1>{_escape_html(title)}</h1>
@@ -1146,38 +1143,123 @@ def build_study_pro_pdf(
     """
     content_html = f"<div class='content'>{content_with_ids}</div>"
 
-    html = f"<!doctype html><html><head><meta charset='utf-8'><style>{css}</style></head><body>{cover_html}{toc_html}{content_html}</body></html>"
-    pdf = weasyprint.HTML(string=html).write_pdf()
-    bio = io.BytesIO(pdf)
-    bio.name = f"study_pro_{uuid.uuid4().hex[:8]}.pdf"
-    bio.seek(0)
-    return bio, bio.name
+    html = f"<!doctype html><html><head><meta charset='utf-8'></head><body>{cover_html}{toc_html}{content_html}</body></html>"
+    return _render_named(html, 'study_pro', 'study_pro')
+
+_MINDMAP_CSS = """
+@import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;700&display=swap');
+@page { size: A4; margin: 1.5cm; }
+body { font-family: 'Cairo', sans-serif; color: #34495E; }
+h1 { color: #2C3E50; font-size: 26pt; text-align: center; border-bottom: 2px solid #005A9C; padding-bottom: 10px; margin-bottom: 25px; }
+pre {
+    font-family: 'Cairo', 'Segoe UI', monospace;
+    white-space: pre-wrap; word-wrap: break-word;
+    background-color: #f7f9fc; border-radius: 8px;
+    padding: 20px; font-size: 12pt; line-height: 1.9;
+    border: 1px solid #e0e5ec; direction: ltr; text-align: left;
+}
+"""
+
 
 def build_mindmap_text_pdf(
     title: str,
     author_username: str,
     mindmap_content: str
 ) -> tuple[io.BytesIO, str]:
-    css = """
-    @import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;700&display=swap');
-    @page { size: A4; margin: 1.5cm; }
-    body { font-family: 'Cairo', sans-serif; color: #34495E; }
-    h1 { color: #2C3E50; font-size: 26pt; text-align: center; border-bottom: 2px solid #005A9C; padding-bottom: 10px; margin-bottom: 25px; }
-    pre {
-        font-family: 'Cairo', 'Segoe UI', monospace;
-        white-space: pre-wrap; word-wrap: break-word;
-        background-color: #f7f9fc; border-radius: 8px;
-        padding: 20px; font-size: 12pt; line-height: 1.9;
-        border: 1px solid #e0e5ec; direction: ltr; text-align: left;
-    }
-    """
     html_body = f"""
     <h1>🧠 خريطة ذهنية: {_escape_html(title)}</h1>
     <pre>{_escape_html(mindmap_content)}</pre>
     """
-    final_html = f"<!doctype html><html><head><meta charset=\"utf-8\"><style>{css}</style></head><body>{html_body}</body></html>"
-    bio = io.BytesIO(weasyprint.HTML(string=final_html).write_pdf())
-    return bio, f"mindmap_{uuid.uuid4().hex[:8]}.pdf"
+    final_html = f"<!doctype html><html><head><meta charset=\"utf-8\"></head><body>{html_body}</body></html>"
+    return _render_named(final_html, 'mindmap', 'mindmap')
+
+
+_DUAL_LANGUAGE_CSS = """
+@import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;800&family=Roboto:wght@400;500;700&display=swap');
+
+@page { size: A4; margin: 2.2cm; }
+body { font-family: 'Cairo', 'Roboto', sans-serif; color: #2F3542; background-color: #f5f7fb; }
+.wrapper { background: #ffffff; border-radius: 20px; padding: 30px 34px; box-shadow: 0 30px 60px rgba(15, 52, 96, 0.09); }
+.badge { display: inline-block; padding: 6px 14px; border-radius: 999px; background: rgba(71, 181, 255, 0.18); color: #0f3460; font-size: 10pt; margin-bottom: 18px; letter-spacing: 0.5px; }
+.title { font-size: 30pt; font-weight: 800; color: #0f3460; margin: 0 0 8px 0; text-align: right; }
+.meta { font-size: 11pt; color: #57606f; text-align: right; margin-bottom: 28px; }
+
+/* Stacked cards */
+.segment-card { border: 1px solid #e8eef6; border-radius: 14px; padding: 14px 16px; margin: 12px 0; box-shadow: 0 10px 24px rgba(15,52,96,0.06); background: linear-gradient(180deg,#ffffff, #fbfdff); }
+.seg-idx { font-weight: 700; color: #0f3460; margin-bottom: 8px; }
+.seg-eng { direction: ltr; text-align: left; font-family: 'Roboto', sans-serif; font-size: 11.4pt; }
+.seg-arb { direction: rtl; text-align: right; font-family: 'Cairo', sans-serif; font-size: 12.2pt; margin-top: 8px; border-top: 1px dashed #dfe6e9; padding-top: 8px; }
+.seg-eng p, .seg-arb p { margin: 0 0 8px 0; line-height: 1.65; }
+
+table { width: 100%; border-collapse: separate; border-spacing: 0 16px; }
+thead th { font-size: 12pt; font-weight: 700; text-transform: uppercase; letter-spacing: 1px; padding: 12px 14px; color: #0f3460; border-bottom: 2px solid rgba(15, 52, 96, 0.18); }
+th.idx { width: 42px; text-align: center; }
+th.eng { text-align: left; direction: ltr; font-family: 'Roboto', sans-serif; }
+th.arb { text-align: right; direction: rtl; font-family: 'Cairo', sans-serif; }
+
+tr.segment-row { background: linear-gradient(135deg, rgba(71, 181, 255, 0.10), rgba(255, 255, 255, 0.95)); box-shadow: 0 18px 40px rgba(15, 52, 96, 0.08); }
+td { padding: 18px 20px; vertical-align: top; }
+td.idx { font-weight: 700; font-size: 12pt; color: #0f3460; text-align: center; }
+td.eng { direction: ltr; text-align: left; font-family: 'Roboto', sans-serif; font-size: 11.4pt; }
+td.arb { direction: rtl; text-align: right; font-family: 'Cairo', sans-serif; font-size: 12.2pt; border-right: 1px dashed rgba(15, 52, 96, 0.12); }
+
+td.eng p, td.arb p { margin: 0 0 12px 0; line-height: 1.65; }
+td.eng p:last-child, td.arb p:last-child { margin-bottom: 0; }
+"""
+
+
+_GLOSSARY_CSS_EXTRA = """
+table.glossary { width:100%; border-collapse:collapse; margin-top:10px; }
+table.glossary th, table.glossary td { border:1px solid #dfe6e9; padding:8px 10px; vertical-align:top; }
+table.glossary th { background:#f1f6ff; color:#0f3460; }
+table.glossary td.t { width: 22%; }
+table.glossary td.a { width: 22%; direction: rtl; text-align:right; }
+table.glossary td.d { width: 56%; }
+/* long glossaries: one grid per row instead of WeasyPrint's table layout */
+.gloss-grid { margin-top:10px; border-top:1px solid #dfe6e9; }
+.gloss-grid .r { display:grid; grid-template-columns: 22% 22% 56%; break-inside: avoid; }
+.gloss-grid .r span { border:1px solid #dfe6e9; border-top:none; padding:8px 10px; }
+.gloss-grid .r.h span { background:#f1f6ff; color:#0f3460; font-weight:bold; }
+.gloss-grid .r span.a { direction: rtl; text-align:right; }
+"""
+
+# CSS ids → template stylesheets; the id (not the parsed CSS) is what crosses the process boundary
+_TEMPLATE_CSS = {
+    'summary_v2': _SUMMARY_V2_CSS,
+    'study_pro': _STUDY_PRO_CSS,
+    'mindmap': _MINDMAP_CSS,
+    'dual_language': _DUAL_LANGUAGE_CSS + _GLOSSARY_CSS_EXTRA,
+}
+
+
+def _render(html: Union[str, io.BytesIO], css_id: str, target: Optional[io.BytesIO] = None) -> Optional[bytes]:
+    """Top-level (picklable) render step: assembled HTML + template CSS id → PDF.
+
+    `html` is either a str or a rewound UTF-8 buffer (streamed to WeasyPrint via file_obj).
+    Returns the PDF bytes, or writes straight into `target` (and returns None) when one is given.
+    """
+    if isinstance(html, io.BytesIO):
+        doc = _wp().HTML(file_obj=html, encoding='utf-8', url_fetcher=_url_fetcher)
+    else:
+        doc = _wp().HTML(string=html, url_fetcher=_url_fetcher)
+    return doc.write_pdf(
+        target=target, stylesheets=[_stylesheet(_TEMPLATE_CSS[css_id])], font_config=_font_config()
+    )
+
+
+def _named_pdf(pdf: bytes, prefix: str) -> tuple[io.BytesIO, str]:
+    bio = io.BytesIO(pdf)
+    bio.name = f"{prefix}_{os.urandom(4).hex()}.pdf"
+    return bio, bio.name
+
+
+def _render_named(html: Union[str, io.BytesIO], css_id: str, prefix: str) -> tuple[io.BytesIO, str]:
+    """Render in-process directly into the returned buffer (no bytes → BytesIO copy)."""
+    bio = io.BytesIO()
+    _render(html, css_id, target=bio)
+    bio.name = f"{prefix}_{os.urandom(4).hex()}.pdf"
+    bio.seek(0)
+    return bio, bio.name
 
 
 def build_dual_language_pdf(
@@ -1191,258 +1273,219 @@ def build_dual_language_pdf(
     layout='columns' → table with EN/AR side by side
     layout='stacked' → per‑segment card with EN on top, AR below (requested)
     """
+    html = _dual_language_html(title, author_username, segments, glossary, layout)
+    return _render_named(html, 'dual_language', 'translation')
 
-    css = """
-    @import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;800&family=Roboto:wght@400;500;700&display=swap');
 
-    @page { size: A4; margin: 2.2cm; }
-    body { font-family: 'Cairo', 'Roboto', sans-serif; color: #2F3542; background-color: #f5f7fb; }
-    .wrapper { background: #ffffff; border-radius: 20px; padding: 30px 34px; box-shadow: 0 30px 60px rgba(15, 52, 96, 0.09); }
-    .badge { display: inline-block; padding: 6px 14px; border-radius: 999px; background: rgba(71, 181, 255, 0.18); color: #0f3460; font-size: 10pt; margin-bottom: 18px; letter-spacing: 0.5px; }
-    .title { font-size: 30pt; font-weight: 800; color: #0f3460; margin: 0 0 8px 0; text-align: right; }
-    .meta { font-size: 11pt; color: #57606f; text-align: right; margin-bottom: 28px; }
-
-    /* Stacked cards */
-    .segment-card { border: 1px solid #e8eef6; border-radius: 14px; padding: 14px 16px; margin: 12px 0; box-shadow: 0 10px 24px rgba(15,52,96,0.06); background: linear-gradient(180deg,#ffffff, #fbfdff); }
-    .seg-idx { font-weight: 700; color: #0f3460; margin-bottom: 8px; }
-    .seg-eng { direction: ltr; text-align: left; font-family: 'Roboto', sans-serif; font-size: 11.4pt; }
-    .seg-arb { direction: rtl; text-align: right; font-family: 'Cairo', sans-serif; font-size: 12.2pt; margin-top: 8px; border-top: 1px dashed #dfe6e9; padding-top: 8px; }
-    .seg-eng p, .seg-arb p { margin: 0 0 8px 0; line-height: 1.65; }
-
-    table { width: 100%; border-collapse: separate; border-spacing: 0 16px; }
-    thead th { font-size: 12pt; font-weight: 700; text-transform: uppercase; letter-spacing: 1px; padding: 12px 14px; color: #0f3460; border-bottom: 2px solid rgba(15, 52, 96, 0.18); }
-    th.idx { width: 42px; text-align: center; }
-    th.eng { text-align: left; direction: ltr; font-family: 'Roboto', sans-serif; }
-    th.arb { text-align: right; direction: rtl; font-family: 'Cairo', sans-serif; }
-
-    tr.segment-row { background: linear-gradient(135deg, rgba(71, 181, 255, 0.10), rgba(255, 255, 255, 0.95)); box-shadow: 0 18px 40px rgba(15, 52, 96, 0.08); }
-    td { padding: 18px 20px; vertical-align: top; }
-    td.idx { font-weight: 700; font-size: 12pt; color: #0f3460; text-align: center; }
-    td.eng { direction: ltr; text-align: left; font-family: 'Roboto', sans-serif; font-size: 11.4pt; }
-    td.arb { direction: rtl; text-align: right; font-family: 'Cairo', sans-serif; font-size: 12.2pt; border-right: 1px dashed rgba(15, 52, 96, 0.12); }
-
-    td.eng p, td.arb p { margin: 0 0 12px 0; line-height: 1.65; }
-    td.eng p:last-child, td.arb p:last-child { margin-bottom: 0; }
+async def build_dual_language_pdf_async(
+    title: str,
+    author_username: str,
+    segments: List[Tuple[str, str]],
+    glossary: Optional[List[Dict[str, str]]] = None,
+    layout: str = 'columns'
+) -> tuple[io.BytesIO, str]:
+    """Same as build_dual_language_pdf, but the WeasyPrint layout runs off the event loop.
+
+    HTML assembly stays in this process; only the HTML buffer and the CSS id are sent to the shared
+    worker pool. Before the app has started the pool, it renders in a thread like asyncio.to_thread.
     """
+    html = _dual_language_html(title, author_username, segments, glossary, layout)
+    if _pdf_pool is None:
+        return await asyncio.to_thread(_render_named, html, 'dual_language', 'translation')
+    loop = asyncio.get_running_loop()
+    pdf = await loop.run_in_executor(_pdf_pool, _render, html, 'dual_language')
+    return _named_pdf(pdf, 'translation')
+
+
+# Support extended segment tuples (eng,arb,head_en,head_ar[,takeaways]) and dicts
+def _nbsp_to_space(s):
+    return s.replace("\xa0", " ") if isinstance(s, str) else s
+
+
+def _normalize_seg_tuple(seg):
+    # Non-breaking spaces are swapped per field here so the finished document needs no extra pass
+    eng, arb, head_en, head_ar, takeaways = _seg_fields(seg)
+    if takeaways:
+        takeaways = [_nbsp_to_space(tk) for tk in takeaways]
+    return _nbsp_to_space(eng), _nbsp_to_space(arb), _nbsp_to_space(head_en), _nbsp_to_space(head_ar), takeaways
+
+
+def _seg_fields(seg):
+    # Fast path: plain (eng, arb) pairs are the common shape
+    if type(seg) is tuple and len(seg) == 2:
+        return seg[0], seg[1], '', '', []
+    if isinstance(seg, (list, tuple)):
+        if len(seg) >= 5:
+            return seg[0], seg[1], seg[2], seg[3], seg[4]
+        if len(seg) >= 4:
+            return seg[0], seg[1], seg[2], seg[3], []
+        elif len(seg) >= 2:
+            return seg[0], seg[1], '', '', []
+    if isinstance(seg, dict):
+        return seg.get('eng',''), seg.get('arb',''), seg.get('head_en',''), seg.get('head_ar',''), seg.get('takeaways', [])
+    return str(seg), '', '', '', []
+
+
+def _parse_adv_items(s: str) -> List[str]:
+    arr = []
+    for ln in (s or '').split('\n'):
+        t = ln.strip()
+        if not t:
+            continue
+        m = _ADV_ITEM_RE.match(t)
+        if m:
+            arr.append(m.group(1).strip())
+    return arr
 
-    def _convert_lists(text: str) -> str:
-        # Convert lines like "1) ..." into ordered lists; lines starting with "- " or "•" to unordered lists
-        raw = text or ''
-        lines = [ln.rstrip() for ln in raw.split('\n')]
-        # Heuristic: convert category lines "X: a, b; Y: c (d, e)" into nested lists
-        def as_category_block(line: str) -> Optional[str]:
-            # Accept English colon ":" or Arabic verbs like "تشمل/تضم/تشتمل على/تتضمن" and Arabic colon-like usage
-            # Normalize Arabic punctuation
-            l = line.strip()
-            if not l:
-                return None
-            # Try English-style categories by ';' or '؛'
-            # Also split a single line into multiple pseudo-categories by ';' or '؛'
-            sep_split = re.split(r'[;؛]', l)
-            cats = [c.strip() for c in sep_split if c.strip()]
-            if not cats:
-                return None
-            li_parts = []
-            for c in cats:
-                # English form: Key: items
-                if ':' in c:
-                    k, v = c.split(':', 1)
-                else:
-                    # Arabic verb form: "أنواع الدراسات تشمل/تضم/تشتمل على/تتضمن ..."
-                    m = re.search(r'^(?P<k>[^:：]+?)\s*(?:[:：]|(?:تشمل|تضم|تشتمل\s+على|تتضمن)\s*)(?P<v>.+)$', c)
-                    if not m:
-                        continue
-                    k, v = m.group('k'), m.group('v')
-                k = _allow_basic_html(k.strip())
-                v = v.strip()
-                # Replace parentheses lists with commas
-                v_norm = re.sub(r'\(([^)]*)\)', r', \1', v)
-                # Split by English or Arabic comma
-                items = [it.strip() for it in re.split(r'[،,]', v_norm) if it.strip()]
-                sub = ''.join(f"<li>{_allow_basic_html(it)}</li>" for it in items)
-                li_parts.append(f"<li><strong>{k}</strong><ul>{sub}</ul></li>")
-            if not li_parts:
-                return None
-            return '<ul>' + ''.join(li_parts) + '</ul>'
-            li_parts = []
-            for c in cats:
-                if ':' in c:
-                    k, v = c.split(':', 1)
-                    k = _allow_basic_html(k.strip())
-                    # Split items by commas; also expand parentheses lists
-                    v = v.strip()
-                    # Replace parentheses groups with commas
-                    v_norm = re.sub(r'\(([^)]*)\)', r', \1', v)
-                    items = [it.strip() for it in v_norm.split(',') if it.strip()]
-                    sub = ''.join(f"<li>{_allow_basic_html(it)}</li>" for it in items)
-                    li_parts.append(f"<li><strong>{k}</strong><ul>{sub}</ul></li>")
-                else:
-                    # Fallback: treat as simple item
-                    li_parts.append(f"<li>{_allow_basic_html(c)}</li>")
-            return '<ul>' + ''.join(li_parts) + '</ul>' if li_parts else None
-
-        out: List[str] = []
-        i = 0
-        while i < len(lines):
-            ln = lines[i].strip()
-            # Category-Style line
-            cat_html = as_category_block(ln)
-            if cat_html:
-                out.append(cat_html)
-                i += 1
-                continue
-            # Numbered (Arabic/Latin numerals) like "1) ...", "١) ...", "1. ...", "١. ..."
-            if re.match(r"^[\d\u0660-\u0669]+[\.)\-]?\s+", ln):
-                items = []
-                while i < len(lines) and re.match(r"^[\d\u0660-\u0669]+[\.)\-]?\s+", lines[i].strip()):
-                    items.append(re.sub(r"^[\d\u0660-\u0669]+[\.)\-]?\s+", '', lines[i].strip()))
-                    i += 1
-                out.append('<ol>' + ''.join(f'<li>{_allow_basic_html(it)}</li>' for it in items) + '</ol>')
-                continue
-            if re.match(r"^(?:[-•–—▪︎·])\s+", ln):
-                items = []
-                while i < len(lines) and re.match(r"^(?:[-•–—▪︎·])\s+", lines[i].strip()):
-                    items.append(re.sub(r"^(?:[-•–—▪︎·])\s+", '', lines[i].strip()))
-                    i += 1
-                out.append('<ul>' + ''.join(f'<li>{_allow_basic_html(it)}</li>' for it in items) + '</ul>')
-                continue
-            # Regular paragraph
-            if ln:
-                out.append(f'<p>{_allow_basic_html(ln)}</p>')
-            i += 1
-        return ''.join(out)
-
-    def _column_html(text: str) -> str:
-        text = text or ""
-        # Keep basic tags and convert simple list patterns
-        return _convert_lists(text)
-
-    rows_html = []
-    # Support extended segment tuples (eng,arb,head_en,head_ar)
-    def _normalize_seg_tuple(seg):
-        if isinstance(seg, (list, tuple)):
-            if len(seg) >= 5:
-                return seg[0], seg[1], seg[2], seg[3], seg[4]
-            if len(seg) >= 4:
-                return seg[0], seg[1], seg[2], seg[3], []
-            elif len(seg) >= 2:
-                return seg[0], seg[1], '', '', []
-        if isinstance(seg, dict):
-            return seg.get('eng',''), seg.get('arb',''), seg.get('head_en',''), seg.get('head_ar',''), seg.get('takeaways', [])
-        return str(seg), '', '', '', []
-
-    def _make_adv_table(eng_text: str, arb_text: str) -> Optional[str]:
-        # Detect simple numbered/bulleted lists and zip them into EN/AR rows
-        def parse_items(s: str) -> List[str]:
-            arr = []
-            for ln in (s or '').split('\n'):
-                t = ln.strip()
-                if not t:
-                    continue
-                m = re.match(r'^(?:\d+[\.)]|[-•])\s*(.*)', t)
-                if m:
-                    arr.append(m.group(1).strip())
-            return arr
-        en_items = parse_items(eng_text)
-        ar_items = parse_items(arb_text)
-        n = min(len(en_items), len(ar_items))
-        if n == 0:
-            return None
-        rows = []
-        for i in range(n):
-            rows.append(f"<tr><td class='en'>{_allow_basic_html(en_items[i])}</td><td class='ar'>{_allow_basic_html(ar_items[i])}</td></tr>")
-        table_css = """
+
+_ADV_TABLE_CSS = """
         table.adv { width:100%; border-collapse:collapse; margin-top:8px; }
         table.adv td { border:1px solid #e8eef6; padding:8px 10px; vertical-align:top; }
         table.adv td.en { direction:ltr; text-align:left; }
         table.adv td.ar { direction:rtl; text-align:right; }
         """
-        return f"<style>{table_css}</style><table class='adv'>{''.join(rows)}</table>"
 
-    if layout == 'columns':
-        for idx, seg in enumerate(segments, 1):
-            eng, arb, head_en, head_ar = _normalize_seg_tuple(seg)
-            rows_html.append(
-                f"<tr class='segment-row'>"
-                f"<td class='idx'>{idx}</td>"
-                f"<td class='eng'>{('<p><strong>' + _allow_basic_html(head_en) + '</strong></p>' if head_en else '') + _column_html(eng)}</td>"
-                f"<td class='arb'>{('<p><strong>' + _allow_basic_html(head_ar) + '</strong></p>' if head_ar else '') + _column_html(arb)}</td>"
-                f"</tr>"
-            )
-        segments_html = (
-            "<table>\n<thead><tr><th class='idx'>#</th><th class='eng'>English Source</th><th class='arb'>الترجمة العربية</th></tr></thead>\n"
-            + f"<tbody>{''.join(rows_html)}</tbody></table>"
-        )
-    else:
-        # stacked layout
-        cards = []
-        for idx, seg in enumerate(segments, 1):
-            eng, arb, head_en, head_ar, takeaways = _normalize_seg_tuple(seg)
-            cards.append(
-                "<div class='segment-card'>"
-                + f"<div class='seg-idx'>Segment {idx}</div>"
-                + (f"<div class='seg-eng'><p><strong>{_allow_basic_html(head_en)}</strong></p>" if head_en else "<div class='seg-eng'>")
-                + _column_html(eng)
-                + "</div>"
-                + (f"<div class='seg-arb'><p><strong>{_allow_basic_html(head_ar)}</strong></p>" if head_ar else "<div class='seg-arb'>")
-                + _column_html(arb)
-                + "</div>"
-                # Advantages/Disadvantages compact table (no EN/AR labels visible)
-                + ( (_make_adv_table(eng, arb) or '') if re.match(r'\s*(advantages|disadvantages|pros|cons)\b', (head_en or ''), flags=re.IGNORECASE) else '' )
-                # Key takeaways bullets (Arabic)
-                + ("<ul>" + ''.join(f"<li>{_allow_basic_html(tk)}</li>" for tk in takeaways) + "</ul>" if takeaways else '')
-                + "<p class='backlink'><a href='#top'>⬆︎ رجوع للأعلى</a></p>"
-                + "</div>"
-            )
-        segments_html = ''.join(cards)
-
-    generated = datetime.utcnow().strftime('%d %B %Y %H:%M UTC')
-    # Optional glossary section
-    glossary_section = ""
-    if glossary:
-        rows = []
-        for item in glossary:
-            term = _escape_html(str(item.get('term', '')))
-            ar = _escape_html(str(item.get('arabic', '')))
-            definition = _escape_html(str(item.get('definition', '')))
-            rows.append(f"<tr><td class='t'>{term}</td><td class='a'>{ar}</td><td class='d'>{definition}</td></tr>")
-        glossary_table = """
-        <h2 style="margin-top:28px">📚 المصطلحات الطبية</h2>
+
+def _make_adv_table(eng_text: str, arb_text: str) -> Optional[str]:
+    # Detect simple numbered/bulleted lists and zip them into EN/AR rows
+    en_items = _parse_adv_items(eng_text)
+    ar_items = _parse_adv_items(arb_text)
+    n = min(len(en_items), len(ar_items))
+    if n == 0:
+        return None
+    rows = []
+    for i in range(n):
+        rows.append(f"<tr><td class='en'>{_allow_basic_html(en_items[i])}</td><td class='ar'>{_allow_basic_html(ar_items[i])}</td></tr>")
+    return f"<style>{_ADV_TABLE_CSS}</style><table class='adv'>{''.join(rows)}</table>"
+
+
+# One stacked-layout card, filled with a single .format() per segment
+_CARD_HTML = (
+    "<div class='segment-card'><div class='seg-idx'>Segment {idx}</div>"
+    "<div class='seg-eng'>{head_en}{eng}</div>"
+    "<div class='seg-arb'>{head_ar}{arb}</div>"
+    "{extras}"
+    "<p class='backlink'><a href='#top'>⬆︎ رجوع للأعلى</a></p></div>"
+)
+
+
+_GLOSSARY_TITLE = """
+        <h2 style="margin-top:28px">📚 المصطلحات الطبية</h2>"""
+_GLOSSARY_HEAD = (_GLOSSARY_TITLE + """
         <table class="glossary">
           <thead><tr><th>Term</th><th>المصطلح</th><th>التعريف</th></tr></thead>
-          <tbody>{rows}</tbody>
+          <tbody>""").encode('utf-8')
+_GLOSSARY_TAIL = b"""</tbody>
         </table>
-        """.replace("{rows}", ''.join(rows))
-        glossary_section = glossary_table
-
-    css_extra = """
-    table.glossary { width:100%; border-collapse:collapse; margin-top:10px; }
-    table.glossary th, table.glossary td { border:1px solid #dfe6e9; padding:8px 10px; vertical-align:top; }
-    table.glossary th { background:#f1f6ff; color:#0f3460; }
-    table.glossary td.t { width: 22%; }
-    table.glossary td.a { width: 22%; direction: rtl; text-align:right; }
-    table.glossary td.d { width: 56%; }
-    """
-
-    html = f"""
+        """
+# Above this many terms the glossary is laid out as grid rows (table layout grows super-linearly)
+_GLOSSARY_GRID_MIN = 50
+_GLOSSARY_GRID_HEAD = (
+    _GLOSSARY_TITLE
+    + "<div class='gloss-grid'><div class='r h'><span>Term</span><span>المصطلح</span><span>التعريف</span></div>"
+).encode('utf-8')
+_GLOSSARY_GRID_TAIL = b"</div>"
+
+
+_COLUMNS_HEAD = (
+    "<table>\n<thead><tr><th class='idx'>#</th><th class='eng'>English Source</th><th class='arb'>الترجمة العربية</th></tr></thead>\n"
+    "<tbody>"
+).encode('utf-8')
+# Page skeleton: only the escaped title, author and date are substituted per call
+_PAGE_HEAD = """
     <html>
     <head><meta charset='utf-8'></head>
     <body>
         <a id='top'></a>
         <div class='wrapper'>
             <div class='badge'>Al Madina Translation Suite</div>
-            <h1 class='title'>{_escape_html(title)}</h1>
-            <div class='meta'>إعداد: @{_escape_html(author_username)} · التاريخ: {generated}</div>
-            {segments_html}
-            {glossary_section}
+            <h1 class='title'>%s</h1>
+            <div class='meta'>إعداد: @%s · التاريخ: %s</div>
+            """
+_PAGE_TAIL = b"""
         </div>
     </body>
     </html>
     """
 
-    html = html.replace("\xa0", " ")
-    pdf_bytes = weasyprint.HTML(string=html).write_pdf(stylesheets=[weasyprint.CSS(string=css + css_extra)])
-    bio = io.BytesIO(pdf_bytes)
-    bio.name = f"translation_{uuid.uuid4().hex[:8]}.pdf"
-    bio.seek(0)
-    return bio, bio.name
+
+# (minute since epoch, formatted stamp) — the page only shows minutes, so format once per minute
+_UTC_STAMP: Tuple[int, str] = (-1, "")
+
+
+def _utc_minute_stamp() -> str:
+    global _UTC_STAMP
+    minute = int(time.time()) // 60
+    if _UTC_STAMP[0] != minute:
+        _UTC_STAMP = (minute, time.strftime('%d %B %Y %H:%M UTC', time.gmtime(minute * 60)))
+    return _UTC_STAMP[1]
+
+
+def _dual_language_html(
+    title: str,
+    author_username: str,
+    segments: List[Tuple[str, str]],
+    glossary: Optional[List[Dict[str, str]]],
+    layout: str,
+) -> io.BytesIO:
+    """Assemble the page straight into a UTF-8 buffer (no full-document str is ever built)."""
+    buf = io.BytesIO()
+    w = buf.write
+    generated = _utc_minute_stamp()
+    safe_title = _escape_html(_nbsp_to_space(title))
+    safe_author = _escape_html(_nbsp_to_space(author_username))
+    w((_PAGE_HEAD % (safe_title, safe_author, generated)).encode('utf-8'))
+
+    if layout == 'columns':
+        w(_COLUMNS_HEAD)
+        for idx, seg in enumerate(segments, 1):
+            eng, arb, head_en, head_ar, _ = _normalize_seg_tuple(seg)
+            head_en_html = f"<p><strong>{_allow_basic_html(head_en)}</strong></p>" if head_en else ''
+            head_ar_html = f"<p><strong>{_allow_basic_html(head_ar)}</strong></p>" if head_ar else ''
+            w((
+                f"<tr class='segment-row'>"
+                f"<td class='idx'>{idx}</td>"
+                f"<td class='eng'>{head_en_html}{_convert_lists(eng)}</td>"
+                f"<td class='arb'>{head_ar_html}{_convert_lists(arb)}</td>"
+                f"</tr>"
+            ).encode('utf-8'))
+        w(b"</tbody></table>")
+    else:
+        # stacked layout
+        for idx, seg in enumerate(segments, 1):
+            eng, arb, head_en, head_ar, takeaways = _normalize_seg_tuple(seg)
+            # Advantages/Disadvantages compact table (no EN/AR labels visible)
+            adv = (_make_adv_table(eng, arb) or '') if head_en and _ADV_RE.match(head_en) else ''
+            # Key takeaways bullets (Arabic)
+            tks = ("<ul>" + ''.join(f"<li>{_allow_basic_html(tk)}</li>" for tk in takeaways) + "</ul>") if takeaways else ''
+            w(_CARD_HTML.format(
+                idx=idx,
+                head_en=f"<p><strong>{_allow_basic_html(head_en)}</strong></p>" if head_en else '',
+                eng=_convert_lists(eng),
+                head_ar=f"<p><strong>{_allow_basic_html(head_ar)}</strong></p>" if head_ar else '',
+                arb=_convert_lists(arb),
+                extras=adv + tks,
+            ).encode('utf-8'))
+
+    w(b"\n            ")
+    # Optional glossary section
+    if glossary:
+        # escape every field in one map() pass, then walk it three cells at a time
+        cells = map(_escape_text, map(_nbsp_to_space, map(str, (
+            v for item in glossary
+            for v in (item.get('term', ''), item.get('arabic', ''), item.get('definition', ''))
+        ))))
+        if len(glossary) > _GLOSSARY_GRID_MIN:
+            w(_GLOSSARY_GRID_HEAD)
+            for term, ar, definition in zip(cells, cells, cells):
+                w(f"<div class='r'><span class='t'>{term}</span><span class='a'>{ar}</span><span class='d'>{definition}</span></div>".encode('utf-8'))
+            w(_GLOSSARY_GRID_TAIL)
+        else:
+            w(_GLOSSARY_HEAD)
+            for term, ar, definition in zip(cells, cells, cells):
+                w(f"<tr><td class='t'>{term}</td><td class='a'>{ar}</td><td class='d'>{definition}</td></tr>".encode('utf-8'))
+            w(_GLOSSARY_TAIL)
+
+    w(_PAGE_TAIL)
+    buf.seek(0)
+    return buf
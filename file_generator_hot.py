@@ -0,0 +1,359 @@
+# file_generator_hot.py
+"""Text → HTML helpers used on every line of the study/translation PDF templates.
+
+Kept free of WeasyPrint and Telegram imports and fully annotated so the module can be
+compiled as-is (``make hot`` → mypyc). A compiled ``file_generator_hot`` extension is
+picked up by the normal import in file_generator; without it this source is used.
+"""
+import functools
+import re
+from html import escape as _html_escape
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def _escape_uncached(s: str) -> str:
+    # quote=False keeps apostrophes as-is (same output as before); only '"' is added back
+    return _html_escape(s, quote=False).replace('"', "&quot;")
+
+
+# Recurring short strings (glossary terms, headings, names) are memoised; long bodies are not,
+# so one big paragraph can't evict hundreds of terms
+_escape_cached = functools.lru_cache(maxsize=4096)(_escape_uncached)
+_ESCAPE_CACHE_MAX_LEN = 128
+
+
+def _escape_text(s: str) -> str:
+    if len(s) < _ESCAPE_CACHE_MAX_LEN:
+        return _escape_cached(s)
+    return _escape_uncached(s)
+
+
+def _escape_html(s: str) -> str:
+    """A minimal HTML escaper for content that will be placed inside tags."""
+    return _escape_text(str(s or ""))
+
+
+_BASIC_TAG_RE = re.compile(r"&lt;(/?(?:b|strong|i|em|ul|ol|li|br|sup|sub|h3|h4|blockquote|span))&gt;")
+
+
+def _allow_basic_html(s: str) -> str:
+    """Escape all HTML then re-allow a safe subset of tags."""
+    if not s:
+        return ""
+    esc = _escape_html(s)
+    # Allow handful of inline/block tags
+    esc = _BASIC_TAG_RE.sub(r"<\1>", esc)
+    return esc
+
+
+_NUM_RE = re.compile(r"^[\d\u0660-\u0669]+[\.)\-]?\s+")
+_BULLET_RE = re.compile(r"^(?:[-•–—▪︎·])\s+")
+# أول حرف يكفي لتحديد نوع السطر في الغالب؛ الـ regex يُستخدم فقط للتأكيد
+_EMOJI_SET = frozenset("📚📖🧠💡📌📝📊✅⚠️🔎🔍🚀🎯🧩")
+_BULLET_CHARS = frozenset("-•–—▪︎·")
+_EMOJI_OR_HASH_SET = _EMOJI_SET | {'#'}
+_H2_WHOLE_LINE_RE = re.compile(r"^<h2>.*</h2>$", re.IGNORECASE)
+_H2_TAG_RE = re.compile(r"<.?h2>", re.IGNORECASE)
+_H3_LINE_RE = re.compile(r"^<h3>.*</h3>$", re.IGNORECASE)
+_H3_TAG_RE = re.compile(r"</?h3>", re.IGNORECASE)
+_BLOCKQUOTE_LINE_RE = re.compile(r"^<blockquote>.*</blockquote>$", re.IGNORECASE)
+_BLOCKQUOTE_TAG_RE = re.compile(r"</?blockquote>", re.IGNORECASE)
+_SEP_RE = re.compile(r'[;؛]')
+_CATEGORY_VERB_RE = re.compile(r'^(?P<k>[^:：]+?)\s*(?:[:：]|(?:تشمل|تضم|تشتمل\s+على|تتضمن)\s*)(?P<v>.+)$')
+_PAREN_RE = re.compile(r'\(([^)]*)\)')
+_COMMA_SPLIT_RE = re.compile(r'[،,]')
+
+SECTION_HEADINGS = {
+    'Complete Outline', 'Concepts & Definitions', 'Definitions', 'Key Facts & Numbers',
+    'Symbols & Notation', 'Formulas & Calculations', 'Processes & Steps',
+    'Examples & Analogies', 'Common Pitfalls', 'Q&A Checkpoints', 'Final Takeaway',
+    'المخطط الكامل', 'المفاهيم والتعاريف', 'التعريفات', 'حقائق وأرقام', 'الرموز والاصطلاحات',
+    'معادلات وحسابات', 'العمليات والخطوات', 'أمثلة وتشبيهات', 'مزالق شائعة',
+    'أسئلة ومراجعات', 'الخلاصة النهائية'
+}
+_SECTION_HEADINGS_LOWER = frozenset(h.lower() for h in SECTION_HEADINGS)
+_SKIP_SECTION_TITLES = frozenset({'complete outline', 'المخطط الكامل'})
+
+HIGHLIGHT_PHRASES = [
+    'Prevalence Rate', 'Incidence Rate', 'Prevalence Ratio', 'Prevalence Odds Ratio',
+    'Cross-sectional study', 'Case-control study', 'Cohort study',
+    'Confidence Interval', 'Temporal relationship', 'Risk factor',
+    'Public health planning', 'Hypothesis generation'
+]
+HIGHLIGHT_WORDS = [
+    'Prevalence', 'Incidence', 'Odds Ratio', 'Risk', 'Cross-sectional',
+    'Study', 'Case-control', 'Cohort', 'Exposure', 'Outcome',
+    'Rate', 'Ratio', 'Duration', 'Etiology', 'Bias', 'Sensitivity',
+    'Specificity', 'Hypothesis', 'Causality', 'Temporal', 'Distribution'
+]
+
+
+def _trie_regex(terms: List[str]) -> str:
+    """Factor a fixed, case-insensitive vocabulary into a prefix-trie regex.
+
+    Shared prefixes are matched once instead of retrying every alternative at each
+    position; a terminal node with children becomes an optional (greedy) tail, so the
+    longest term still wins, as with a longest-first alternation.
+    """
+    trie: Dict[str, dict] = {}
+    for term in terms:
+        node = trie
+        for ch in term.lower():
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def _emit(node: Dict[str, dict]) -> str:
+        end = '' in node
+        branches = [re.escape(ch) + _emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            return (body if len(branches) > 1 else '(?:' + body + ')') + '?'
+        return body
+
+    return _emit(trie)
+
+
+# نمط واحد للعبارات ثم الكلمات ثم المعادلات: العبارة تسبق الكلمة عند نفس الموضع
+_TERMS_PATTERN = r"(?P<phrase>" + _trie_regex(HIGHLIGHT_PHRASES) + r")|\b(?P<word>" + _trie_regex(HIGHLIGHT_WORDS) + r")\b"
+_HILITE_RE = re.compile(_TERMS_PATTERN + r"|(?P<eq>[A-Za-z][A-Za-z\s]{0,12}=\s*[^<\n]+)", re.IGNORECASE)
+# بدون '=' لا يمكن أن تتطابق المعادلة، فلا داعي لتجربة فرعها عند كل حرف
+_TERMS_RE = re.compile(_TERMS_PATTERN, re.IGNORECASE)
+
+
+# كل تطابق يبدأ بأول حرف من مصطلح (بأي حالة) أو يحتوي على '=' للمعادلات
+_HILITE_TRIGGER_CHARS = frozenset(
+    ''.join(t[0].lower() + t[0].upper() for t in HIGHLIGHT_PHRASES + HIGHLIGHT_WORDS) + '='
+)
+
+
+def _hilite_repl(m: "re.Match[str]") -> str:
+    kind = m.lastgroup
+    if kind == 'phrase':
+        return f"<span class='hl-term'>{m.group(0)}</span>"
+    if kind == 'word':
+        return f"<span class='em'>{m.group(0)}</span>"
+    return f"<span class='hl-math'>{m.group(0).strip()}</span>"
+
+
+def _highlight_part(part: str) -> str:
+    return (_HILITE_RE if '=' in part else _TERMS_RE).sub(_hilite_repl, part)
+
+
+def _iter_text_chunks(s: str) -> Iterator[Tuple[bool, str]]:
+    """Split into (is_tag, chunk) pieces, where a tag is '<' + one or more non-'>' chars + '>'."""
+    i = 0
+    n = len(s)
+    start = 0  # text chunk start; may trail i when a '<' turned out not to open a tag
+    while i < n:
+        lt = s.find('<', i)
+        if lt < 0:
+            break
+        gt = s.find('>', lt + 1)
+        if gt < 0:
+            break
+        if gt == lt + 1:  # "<>" is text
+            i = gt + 1
+            continue
+        if lt > start:
+            yield False, s[start:lt]
+        yield True, s[lt:gt + 1]
+        i = start = gt + 1
+    if start < n:
+        yield False, s[start:]
+
+
+def _highlight(html_text: str) -> str:
+    """Highlight key terms and equations in text parts only (tags are left intact)."""
+    if not html_text or _HILITE_TRIGGER_CHARS.isdisjoint(html_text):
+        return html_text
+    if '<' not in html_text:
+        return _highlight_part(html_text)
+    out: List[str] = []
+    for is_tag, chunk in _iter_text_chunks(html_text):
+        out.append(chunk if is_tag or chunk[0] == '<' else _highlight_part(chunk))
+    return ''.join(out)
+
+
+def _is_list_line(s: str) -> bool:
+    first = s[:1]
+    if first in _EMOJI_SET:
+        return True
+    if first.isdigit():
+        return _NUM_RE.match(s) is not None
+    if first in _BULLET_CHARS:
+        return _BULLET_RE.match(s) is not None
+    return False
+
+
+# أي سطر فئة يحتاج نقطتين أو أحد أفعال الاحتواء؛ غير ذلك لا داعي لتجربة التقسيم
+_CATEGORY_HINTS = (':', '：', 'تشمل', 'تضم', 'تشتمل', 'تتضمن')
+
+
+def _category_block(line: str) -> Optional[str]:
+    """Turn category lines like "X: a, b; Y: c (d, e)" into nested lists (English ':' or Arabic verbs)."""
+    li_parts = []
+    for c in _SEP_RE.split(line):
+        c = c.strip()
+        if not c:
+            continue
+        # English form: Key: items
+        if ':' in c:
+            k, v = c.split(':', 1)
+        else:
+            # Arabic verb form: "أنواع الدراسات تشمل/تضم/تشتمل على/تتضمن ..."
+            m = _CATEGORY_VERB_RE.search(c)
+            if not m:
+                continue
+            k, v = m.group('k'), m.group('v')
+        # Replace parentheses lists with commas, then split by English or Arabic comma
+        v_norm = _PAREN_RE.sub(r', \1', v.strip())
+        li_parts.append(f"<li><strong>{_allow_basic_html(k.strip())}</strong><ul>")
+        li_parts.extend(f"<li>{_allow_basic_html(it.strip())}</li>" for it in _COMMA_SPLIT_RE.split(v_norm) if it.strip())
+        li_parts.append("</ul></li>")
+    if not li_parts:
+        return None
+    return '<ul>' + ''.join(li_parts) + '</ul>'
+
+
+def _parse_sections(lines: List[str]) -> List[Dict[str, Any]]:
+    sections: List[Dict[str, Any]] = []
+    current: Dict[str, Any] = {'title': None, 'items': []}
+    skipping = False
+    for ln in lines:
+        s = (ln or '').strip()
+        if not s:
+            continue
+        low = s.lower()
+        is_heading = (low in _SECTION_HEADINGS_LOWER) or _H2_WHOLE_LINE_RE.match(s)
+        if is_heading:
+            title_text = _H2_TAG_RE.sub("", s)
+            title_text = title_text if title_text else s
+            if current['items'] and not skipping:
+                sections.append(current)
+            skipping = title_text.lower() in _SKIP_SECTION_TITLES
+            current = {'title': title_text if not skipping else None, 'items': []}
+            continue
+        if skipping:
+            continue
+        current.setdefault('items', []).append(s)
+    if current['items'] and not skipping:
+        sections.append(current)
+    return [sec for sec in sections if sec.get('title')]
+
+
+def _format_segment(raw: str, *, prefix: Optional[str] = None) -> str:
+    txt = _allow_basic_html(raw or '')
+    if prefix and not txt.strip().startswith(prefix):
+        txt = f"{prefix} {txt.strip()}"
+    return _highlight(txt)
+
+
+def _render_items(items: List[str]) -> str:
+    out: List[str] = []
+    i = 0
+    n = len(items)
+    while i < n:
+        raw = items[i]
+        s = raw.strip()
+        first = s[:1]
+        # Subheadings
+        if first == '<' and _H3_LINE_RE.match(s):
+            sub = _H3_TAG_RE.sub("", s).strip()
+            out.append(f"<div class='subheading'>{_escape_html(sub)}</div>")
+            i += 1
+            continue
+        # Blockquotes / insights
+        if first == '<' and _BLOCKQUOTE_LINE_RE.match(s):
+            inner = _BLOCKQUOTE_TAG_RE.sub("", s)
+            out.append(f"<blockquote class='deep-quote'>{_format_segment(inner)}</blockquote>")
+            i += 1
+            continue
+        # Lists (emoji / hyphen / numbered)
+        if _is_list_line(s):
+            out.append('<ul>')
+            while i < n:
+                cur = items[i].strip()
+                if not _is_list_line(cur):
+                    break
+                entry = _NUM_RE.sub('', cur, count=1) if cur[:1].isdigit() else cur
+                if entry[:1] in _BULLET_CHARS:
+                    entry = _BULLET_RE.sub('', entry, count=1)
+                if entry[:1] not in _EMOJI_OR_HASH_SET:
+                    entry = f"📚 {entry}"
+                out.append(f"<li>{_format_segment(entry)}</li>")
+                i += 1
+            out.append('</ul>')
+            continue
+        # Q&A blocks
+        if first == '❓':
+            question = s
+            answer = ''
+            if i + 1 < n and items[i+1].strip().startswith('✅'):
+                answer = items[i+1].strip()
+                i += 1
+            out.extend((
+                "<div class='qa'><p class='q'>", _format_segment(question),
+                "</p><p class='a'>", _format_segment(answer), "</p></div>",
+            ))
+            i += 1
+            continue
+        # Process flow (arrows)
+        if '→' in s or '->' in s:
+            steps = [seg.strip() for seg in s.replace('->', '→').split('→') if seg.strip()]
+            out.append("<div class='flow'>")
+            out.extend(f"<span>{_format_segment(step)}</span>" for step in steps)
+            out.append("</div>")
+            i += 1
+            continue
+        # Fact boxes (# ...)
+        if first == '#':
+            fact = s.lstrip('#').strip()
+            out.append(f"<div class='fact'><strong>FACT</strong> {_format_segment(fact)}</div>")
+            i += 1
+            continue
+        out.append(f"<p class='lead'>{_format_segment(s)}</p>")
+        i += 1
+    return ''.join(out)
+
+
+def _convert_lists(text: str) -> str:
+    # Convert lines like "1) ..." into ordered lists; lines starting with "- " or "•" to unordered lists
+    out: List[str] = []
+    open_list = None  # 'ol' / 'ul' while a run of list lines is being collected
+    for raw_ln in (text or '').split('\n'):
+        ln = raw_ln.strip()
+        first = ln[:1]
+        # Continue the current run; a numbered/bulleted run swallows category-looking lines too
+        if open_list == 'ol' and first.isdigit() and _NUM_RE.match(ln):
+            out.append(f'<li>{_allow_basic_html(_NUM_RE.sub("", ln, count=1))}</li>')
+            continue
+        if open_list == 'ul' and first in _BULLET_CHARS and _BULLET_RE.match(ln):
+            out.append(f'<li>{_allow_basic_html(_BULLET_RE.sub("", ln, count=1))}</li>')
+            continue
+        if open_list:
+            out.append(f'</{open_list}>')
+            open_list = None
+        if not ln:
+            continue
+        # Category-Style line
+        if any(h in ln for h in _CATEGORY_HINTS):
+            cat_html = _category_block(ln)
+            if cat_html:
+                out.append(cat_html)
+                continue
+        # Numbered (Arabic/Latin numerals) like "1) ...", "١) ...", "1. ...", "١. ..."
+        if first.isdigit() and _NUM_RE.match(ln):
+            open_list = 'ol'
+            out.append(f'<ol><li>{_allow_basic_html(_NUM_RE.sub("", ln, count=1))}</li>')
+            continue
+        if first in _BULLET_CHARS and _BULLET_RE.match(ln):
+            open_list = 'ul'
+            out.append(f'<ul><li>{_allow_basic_html(_BULLET_RE.sub("", ln, count=1))}</li>')
+            continue
+        # Regular paragraph
+        out.append(f'<p>{_allow_basic_html(ln)}</p>')
+    if open_list:
+        out.append(f'</{open_list}>')
+    return ''.join(out)
@@ -2,15 +2,21 @@
 import asyncio
 import logging
 import csv
-import tempfile
+import io
 import datetime
+import operator
+import pathlib
 import random
 import re
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 
-import database
+import db_async
+from broadcast import broadcast
+from update_processor import user_row_guard
 from handlers.common_handlers import start_cmd, features_callback_router
 from handlers.main_handler import main_menu_router, style_selection_handler
 import keyboards
@@ -19,8 +25,11 @@ from utils import safe_md, beautify_text
 
 logger = logging.getLogger(__name__)
 
+# config.ADMIN_USER_IDS is fixed at startup; a frozenset makes the per-callback check O(1)
+_ADMIN_IDS = frozenset(config.ADMIN_USER_IDS)
+
 def is_admin(user_id: int) -> bool:
-    return user_id in config.ADMIN_USER_IDS
+    return user_id in _ADMIN_IDS
 
 # --- Entry Point ---
 async def admin_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -46,124 +55,123 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # في ملف handlers/admin_handler.py
 async def admin_panel_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
-    await query.answer()
-    data = query.data
-    
+    # التحقق قبل answer(): الضغطة المرفوضة تاخد طلب API واحد بس (الـ alert)
     if not is_admin(update.effective_user.id):
         await query.answer("🚫 غير مصرح لك.", show_alert=True)
         return ConversationHandler.END
 
-    # --- القسم الأول: الأزرار العامة التي لا تستهدف مستخدم معين ---
-    if data == "admin_stats":
-        await admin_stats_handler(update, context)
-        return config.ADMIN_PANEL
-
-    if data == "admin_reports":
-        await admin_logs_handler(update, context)
-        return config.ADMIN_PANEL
-
-    if data == "admin_export_users":
-        await admin_export_users(update, context)
-        return config.ADMIN_PANEL
-    
-    if data == "admin_broadcast":
-        await query.edit_message_text("✍️ اكتب الرسالة التي سيتم بثها لجميع المستخدمين:")
-        return config.ADMIN_BROADCAST_WAIT
+    await query.answer()
+    data = query.data
 
-    if data == "admin_test_all":
-        await admin_test_all_buttons(update, context)
-        return config.ADMIN_PANEL
-    
-    if data == "admin_users" or data.startswith("admin_users_page_"):
+    # --- القسم الأول: الأزرار العامة التي لا تستهدف مستخدم معين ---
+    action = _PANEL_ACTIONS.get(data)
+    if action is not None:
+        next_state = await action(update, context)
+        return config.ADMIN_PANEL if next_state is None else next_state
+
+    prompt = _PANEL_PROMPTS.get(data)
+    if prompt is not None:
+        text, next_state = prompt
+        await query.edit_message_text(text)
+        return next_state
+
+    if data.startswith("admin_users_"):
         await admin_users_list(update, context)
         return config.ADMIN_PANEL
 
-    if data == "admin_pick_user_by_id":
-        await query.edit_message_text("👤 أدخل ID المستخدم الذي تريد تعديل بياناته:")
-        return config.ADMIN_PICK_USER 
-    
-    # --- ✨ التعديل المضاف هنا لتشغيل زر الإعدادات ---
-    if data == "admin_settings":
-        await admin_settings_menu(update, context)
-        return config.ADMIN_PANEL
-
-    if data == "admin_set_channel":
-        await query.edit_message_text(
-            "أرسل يوزر القناة الجديد (مثال: `@my_channel`)\n"
-            "أو أرسل `off` لإلغاء الاشتراك الإجباري."
-        )
-        return config.ADMIN_SET_CHANNEL_WAIT
-    # --- نهاية التعديل ---
-
     # --- القسم الثاني: الأزرار التي تستهدف مستخدم معين ---
-    if "_" in data:
-        try:
-            target_id = int(data.split("_")[-1])
-            target_user = database._get_user_from_db(target_id)
-            if not target_user:
-                await query.answer("❌ مستخدم غير موجود.", show_alert=True)
-                return config.ADMIN_PANEL
-
-            if data.startswith("admin_tokens_inc_"):
-                target_user["tokens"] = target_user.get("tokens", 0) + 100
-                database._update_user_in_db(target_id, target_user)
-                await _refresh_user_view(update, context, target_id)
-                return config.ADMIN_PANEL
-
-            elif data.startswith("admin_tokens_dec_"):
-                target_user["tokens"] = max(0, target_user.get("tokens", 0) - 100)
-                database._update_user_in_db(target_id, target_user)
-                await _refresh_user_view(update, context, target_id)
-                return config.ADMIN_PANEL
-
-            elif data.startswith("admin_tokens_set_"):
-                context.user_data['admin_target_user'] = target_id
-                await query.edit_message_text(f"✍️ أرسل العدد الجديد من التوكنز للمستخدم `{target_id}`:")
-                return config.ADMIN_SET_TOKENS_WAIT
-
-            elif data.startswith("admin_subs_set_"):
-                context.user_data['admin_target_user'] = target_id
-                await query.edit_message_text(f"📦 أرسل الحد الأقصى الجديد للملفات للمستخدم `{target_id}`:")
-                return config.ADMIN_SET_SUBS_WAIT
-            
-            elif data.startswith("admin_ban_toggle_"):
+    m = _TARGET_ACTION_RE.match(data)
+    if m:
+        kind, target_id = m.group(1), int(m.group(2))
+        if kind in ("admin_tokens_inc", "admin_tokens_dec"):
+            # تعديل ذري في SQLite بدل read-modify-write، فالضغطات المتتالية ما بتضيعش
+            delta = 100 if kind == "admin_tokens_inc" else -100
+            async with user_row_guard(update, context, target_id):
+                target_user = await db_async.increment_tokens(target_id, delta)
+        else:
+            target_user = await db_async.get_user(target_id)
+        if not target_user:
+            await query.answer("❌ مستخدم غير موجود.", show_alert=True)
+            return config.ADMIN_PANEL
+
+        if kind in ("admin_tokens_inc", "admin_tokens_dec"):
+            await _refresh_user_view(update, context, target_id, target_user)
+            return config.ADMIN_PANEL
+
+        elif kind == "admin_tokens_set":
+            context.user_data['admin_target_user'] = target_id
+            await query.edit_message_text(f"✍️ أرسل العدد الجديد من التوكنز للمستخدم `{target_id}`:")
+            return config.ADMIN_SET_TOKENS_WAIT
+
+        elif kind == "admin_subs_set":
+            context.user_data['admin_target_user'] = target_id
+            await query.edit_message_text(f"📦 أرسل الحد الأقصى الجديد للملفات للمستخدم `{target_id}`:")
+            return config.ADMIN_SET_SUBS_WAIT
+
+        elif kind == "admin_ban_toggle":
+            async with user_row_guard(update, context, target_id):
+                # إعادة قراءة تحت القفل عشان ما نكتبش نسخة قديمة فوق شغل المستخدم
+                target_user = await db_async.get_user(target_id) or target_user
                 target_user["banned"] = not target_user.get("banned", False)
-                database._update_user_in_db(target_id, target_user)
-                await query.answer("✅ تم تبديل حالة الحظر.", show_alert=True)
-                await _refresh_user_view(update, context, target_id)
-                return config.ADMIN_PANEL
-
-            elif data.startswith("admin_dm_user_"):
-                context.user_data['admin_dm_target'] = target_id
-                await query.edit_message_text(f"✉️ اكتب الرسالة ليتم إرسالها إلى {target_id}:")
-                return config.ADMIN_DM_WAIT
-
-        except (ValueError, IndexError):
-            pass
-
-    # هذا الزر يجب أن يكون في النهاية كخيار للخروج
-    if data == "back_main":
-        await admin_exit_to_main(update, context)
-        return ConversationHandler.END
+                await db_async.update_user(target_id, target_user)
+            await query.answer("✅ تم تبديل حالة الحظر.", show_alert=True)
+            await _refresh_user_view(update, context, target_id, target_user)
+            return config.ADMIN_PANEL
+
+        else:  # admin_dm_user
+            context.user_data['admin_dm_target'] = target_id
+            await query.edit_message_text(f"✉️ اكتب الرسالة ليتم إرسالها إلى {target_id}:")
+            return config.ADMIN_DM_WAIT
 
     # إذا لم يتطابق أي شرط، ابق في لوحة التحكم
     return config.ADMIN_PANEL
 
 
+# أزرار تستهدف مستخدم: "<action>_<user_id>" — مطابقة واحدة بدل سلسلة startswith
+_TARGET_ACTION_RE = re.compile(
+    r"^(admin_tokens_inc|admin_tokens_dec|admin_tokens_set|admin_subs_set|admin_ban_toggle|admin_dm_user)_(\d+)$"
+)
+
+# أزرار تطلب إدخال نص من الأدمن: الرسالة + الحالة التالية
+_PANEL_PROMPTS = {
+    "admin_broadcast": ("✍️ اكتب الرسالة التي سيتم بثها لجميع المستخدمين:", config.ADMIN_BROADCAST_WAIT),
+    "admin_pick_user_by_id": ("👤 أدخل ID المستخدم الذي تريد تعديل بياناته:", config.ADMIN_PICK_USER),
+    "admin_set_channel": (
+        "أرسل يوزر القناة الجديد (مثال: `@my_channel`)\n"
+        "أو أرسل `off` لإلغاء الاشتراك الإجباري.",
+        config.ADMIN_SET_CHANNEL_WAIT,
+    ),
+}
+
+
+class _Override:
+    """Delegates every attribute to `target` except the ones given as overrides.
+
+    PTB objects are frozen, so this is how a callback gets "new data" without rebuilding
+    the CallbackQuery/Update through to_dict()/de_json().
+    """
+    __slots__ = ('_target', '_overrides')
+
+    def __init__(self, target, **overrides):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_overrides', overrides)
+
+    def __getattr__(self, name):
+        overrides = object.__getattribute__(self, '_overrides')
+        if name in overrides:
+            return overrides[name]
+        return getattr(object.__getattribute__(self, '_target'), name)
+
+
 def _clone_callback(update: Update, data: str):
-    """Create a synthetic Update carrying a callback_query with new data."""
-    query = update.callback_query
-    from telegram import Update as TgUpdate
-    payload = query.to_dict()
-    payload['data'] = data
-    cbq = type(query).de_json(payload, query._bot)
-    return TgUpdate(update_id=update.update_id or 0, callback_query=cbq)
+    """Same update, but its callback_query reports `data` (answer/edit still hit the real query)."""
+    return _Override(update, callback_query=_Override(update.callback_query, data=data))
 
 
 async def admin_test_all_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Seeds sample content then runs core feature callbacks sequentially for the admin."""
     query = update.callback_query
-    admin_user = database.ensure_user(query.from_user.id, query.from_user.full_name)
+    admin_user = await db_async.ensure_user(query.from_user.id, query.from_user.full_name)
 
     sample = (
         "Types of Studies: Observational, Interventional, Descriptive, Analytical; "
@@ -173,7 +181,7 @@ async def admin_test_all_buttons(update: Update, context: ContextTypes.DEFAULT_T
         "Sampling: Probability (Simple random, Systematic, Stratified, Cluster); Non-probability (Convenience, Quota, Purposive)."
     )
     admin_user['session']['last_text'] = sample
-    database._update_user_in_db(admin_user['id'], admin_user)
+    await db_async.update_user(admin_user['id'], admin_user)
 
     await query.edit_message_text("🧪 جاري اختبار الأزرار الأساسية على عيّنة نصية…")
 
@@ -196,13 +204,13 @@ async def admin_test_all_buttons(update: Update, context: ContextTypes.DEFAULT_T
         'feature_flashcards', 'feature_focus_notes', 'feature_study_plan',
         'feature_text_to_pdf', 'feature_text_to_image', 'feature_summarize_pdf', 'feature_translate_dual'
     ]
+    # كلهم بيكتبوا على نفس صف الأدمن (library + session)، فلازم واحدة ورا التانية
     for key in feature_keys:
         upd = _clone_callback(update, key)
         try:
             await features_callback_router(upd, context)
         except Exception as e:
             logger.error(f"Admin test failed on {key}: {e}")
-        await asyncio.sleep(0.3)
 
     await context.bot.send_message(chat_id=admin_user['id'], text="✅ اكتمل الاختبار الآلي للأزرار الأساسية.")
 async def handle_set_tokens(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -212,12 +220,14 @@ async def handle_set_tokens(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return await admin_entry(update, context)
     try:
         new_tokens = int(update.message.text.strip())
-        target_user = database._get_user_from_db(target_id)
+        async with user_row_guard(update, context, target_id):
+            target_user = await db_async.get_user(target_id)
+            if target_user:
+                target_user['tokens'] = new_tokens
+                await db_async.update_user(target_id, target_user)
         if target_user:
-            target_user['tokens'] = new_tokens
-            database._update_user_in_db(target_id, target_user)
             await update.message.reply_text(f"✅ تم تحديث رصيد المستخدم `{target_id}` إلى {new_tokens:,} توكنز.")
-            await _refresh_user_view(update, context, target_id)
+            await _refresh_user_view(update, context, target_id, target_user)
     except (ValueError, TypeError):
         await update.message.reply_text("⚠️ يرجى إدخال رقم صحيح.")
         context.user_data['admin_target_user'] = target_id
@@ -232,12 +242,14 @@ async def handle_set_subs(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return await admin_entry(update, context)
     try:
         new_limit = int(update.message.text.strip())
-        target_user = database._get_user_from_db(target_id)
+        async with user_row_guard(update, context, target_id):
+            target_user = await db_async.get_user(target_id)
+            if target_user:
+                target_user['subscription_limit'] = new_limit
+                await db_async.update_user(target_id, target_user)
         if target_user:
-            target_user['subscription_limit'] = new_limit
-            database._update_user_in_db(target_id, target_user)
             await update.message.reply_text(f"✅ تم تحديث حد الملفات للمستخدم `{target_id}` إلى {new_limit}.")
-            await _refresh_user_view(update, context, target_id)
+            await _refresh_user_view(update, context, target_id, target_user)
     except (ValueError, TypeError):
         await update.message.reply_text("⚠️ يرجى إدخال رقم صحيح.")
         context.user_data['admin_target_user'] = target_id
@@ -245,25 +257,33 @@ async def handle_set_subs(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     return config.ADMIN_PANEL
 # --- Broadcast Feature ---
+# نصوص ثابتة بتتبعت لكل المستخدمين؛ بتتبني مرة واحدة مش مع كل ضغطة
+_GIFT_MSG = "🎁 تم إضافة 100 نقطة هدية لك من الأدمن!"
+_NIGHT_MODE_MSG = "🌙 تم تفعيل الوضع الليلي! استمتع بتجربة أهدأ."
+_WELCOME_CAPTION = "👋 مرحبًا بك في أقوى بوت تعليمي!"
+_POLL_QUESTION = "ما رأيك في الميزة الجديدة؟"
+_POLL_OPTIONS = ("ممتازة!", "جيدة", "لا أحتاجها")
+_DAILY_QUOTES = (
+    "💡 العلم نور، والجهل ظلام.",
+    "🚀 لا يوجد مستحيل مع الإرادة.",
+    "📚 المذاكرة طريق النجاح.",
+    "🌟 كل يوم فرصة جديدة للتعلم.",
+    "🧠 الذكاء في الاستمرار، لا في البداية فقط.",
+)
+
 async def do_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = (update.message.text or "").strip()
     if not text:
         await update.message.reply_text("⚠️ يرجى إرسال رسالة نصية للبث.")
         return config.ADMIN_BROADCAST_WAIT
         
-    user_ids = database.get_all_user_ids()
-    sent_count = 0
-    failed_count = 0
+    total = await db_async.count_users()
     
-    await update.message.reply_text(f"⏳ جاري بدء البث إلى {len(user_ids)} مستخدم...")
+    await update.message.reply_text(f"⏳ جاري بدء البث إلى {total} مستخدم...")
 
-    for user_id in user_ids:
-        try:
-            await context.bot.send_message(chat_id=user_id, text=f"📢 رسالة من الأدمن:\n\n{text}")
-            sent_count += 1
-        except Exception:
-            failed_count += 1
-        await asyncio.sleep(0.1) # To avoid hitting Telegram API limits
+    message = f"📢 رسالة من الأدمن:\n\n{text}"
+    sent_count = await broadcast(None, lambda uid: context.bot.send_message(chat_id=uid, text=message))
+    failed_count = max(0, total - sent_count)
 
     await update.message.reply_text(f"✅ تم إكمال البث.\n\n- نجح: {sent_count}\n- فشل: {failed_count}")
     return ConversationHandler.END
@@ -271,9 +291,13 @@ async def do_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 # --- User Management ---
 # ضيف دي في أول الملف بعد الـ imports وقبل دالة admin_entry
-async def _refresh_user_view(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    """Updates the user info message after an action."""
-    user = database._get_user_from_db(user_id)
+async def _refresh_user_view(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, user: Optional[dict] = None):
+    """Updates the user info message after an action.
+
+    Callers that just wrote `user` pass it in, so the view doesn't re-read the row it saved.
+    """
+    if user is None:
+        user = await db_async.get_user(user_id)
     if not user:
         await update.callback_query.edit_message_text("❌ المستخدم لم يعد موجودًا.")
         return
@@ -288,28 +312,43 @@ async def _refresh_user_view(update: Update, context: ContextTypes.DEFAULT_TYPE,
     await update.callback_query.edit_message_text(
         msg, reply_markup=keyboards.admin_user_view_kb(user_id), parse_mode=ParseMode.MARKDOWN
     )
+_USER_ROW = "👤 `{id}` - {name}\n   - 📞: `{phone}` | 🎟️: {tokens}"
+
 async def admin_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
-    all_users = database.get_all_users_detailed() # Requires a new DB function
-    
-    if not all_users:
+    items_per_page = 10
+    # admin_users_next_<id> / admin_users_prev_<id>: keyset cursor على id بدل رقم صفحة
+    # (بنطلب صف زيادة عشان نعرف لو فيه صفحة بعدها من غير COUNT(*))
+    data = query.data or ""
+    cursor_id = int(data.rsplit('_', 1)[-1]) if data.startswith(("admin_users_next_", "admin_users_prev_")) else None
+    users_on_page = []
+    if cursor_id is not None and data.startswith("admin_users_prev_"):
+        users_on_page = await db_async.get_users_page(after_id=cursor_id, limit=items_per_page + 1)
+        has_prev, has_next = len(users_on_page) > items_per_page, True
+        users_on_page = users_on_page[-items_per_page:]
+    elif cursor_id is not None:
+        users_on_page = await db_async.get_users_page(before_id=cursor_id, limit=items_per_page + 1)
+        has_prev, has_next = True, len(users_on_page) > items_per_page
+        users_on_page = users_on_page[:items_per_page]
+    if not users_on_page:
+        # أول صفحة (أو المؤشر لم يعد يشير لمستخدمين موجودين)
+        users_on_page = await db_async.get_users_page(limit=items_per_page + 1)
+        has_prev, has_next = False, len(users_on_page) > items_per_page
+        users_on_page = users_on_page[:items_per_page]
+
+    if not users_on_page:
         await query.edit_message_text("لا يوجد مستخدمون مسجلون بعد.", reply_markup=keyboards.back_to_menu_kb())
         return config.ADMIN_PANEL
 
-    page = int(query.data.split('_')[-1]) if query.data.startswith("admin_users_page_") else 0
-    items_per_page = 10
-    start_index = page * items_per_page
-    end_index = start_index + items_per_page
-    users_on_page = all_users[start_index:end_index]
-
-    text_lines = ["👥 **قائمة المستخدمين**\n"]
-    for u in users_on_page:
-        line = (f"👤 `{u['id']}` - {safe_md(u.get('name', 'N/A'))}\n"
-                f"   - 📞: `{u.get('phone_number', 'N/A')}` | 🎟️: {u.get('tokens', 0)}")
-        text_lines.append(line)
-
-    keyboard = keyboards.admin_user_list_kb(page, len(all_users), items_per_page)
-    await query.edit_message_text("\n".join(text_lines), reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+    text = "\n".join([
+        "👥 **قائمة المستخدمين**\n",
+        *(_USER_ROW.format(id=u['id'], name=safe_md(u.get('name', 'N/A')),
+                           phone=u.get('phone_number', 'N/A'), tokens=u.get('tokens', 0))
+          for u in users_on_page),
+    ])
+
+    keyboard = keyboards.admin_user_cursor_kb(users_on_page[0]['id'], users_on_page[-1]['id'], has_prev, has_next)
+    await query.edit_message_text(text, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
     return config.ADMIN_PANEL
 
 # ... (We will need to add more admin functions like editing users, but this is a solid start) ...
@@ -318,10 +357,8 @@ async def admin_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 # --- Settings Management ---
 # ضيف الدالة دي في handlers/admin_handler.py
 
-async def admin_settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Displays the bot's settings menu to the admin."""
-    query = update.callback_query
-    settings = database.get_settings()
+async def _render_settings(send, settings: dict) -> None:
+    """Renders the settings menu through `send` (query.edit_message_text or message.reply_text)."""
     # جلب القناة الحالية، ولو مش موجودة بنحط قيمة افتراضية
     channel = settings.get("force_sub_channel", "لم يتم التعيين")
     
@@ -334,7 +371,12 @@ async def admin_settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
     # استخدام الكيبورد من ملف keyboards.py
     keyboard = keyboards.admin_settings_kb(current_channel=channel)
     
-    await query.edit_message_text(text, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+    await send(text, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+
+async def admin_settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Displays the bot's settings menu to the admin."""
+    settings = await db_async.cached_settings()
+    await _render_settings(update.callback_query.edit_message_text, settings)
     
     # نرجع لنفس الحالة لأننا لسه في لوحة التحكم
     return config.ADMIN_PANEL
@@ -352,7 +394,7 @@ async def admin_set_channel_apply(update: Update, context: ContextTypes.DEFAULT_
     """Saves the new force-subscribe channel sent by the admin."""
     new_channel = update.message.text.strip()
     
-    settings = database.get_settings()
+    settings = await db_async.cached_settings()
     
     if new_channel.lower() == 'off':
         settings["force_sub_channel"] = None
@@ -365,29 +407,21 @@ async def admin_set_channel_apply(update: Update, context: ContextTypes.DEFAULT_
         settings["force_sub_channel"] = new_channel
         await update.message.reply_text(f"✅ تم تحديث قناة الاشتراك إلى: `{new_channel}`", parse_mode=ParseMode.MARKDOWN)
 
-    database.save_settings(settings)
+    await db_async.save_settings(settings)
     
-    # نرجع الأدمن لقائمة الإعدادات عشان يشوف التغيير
-    # هنعمل محاكاة لـ Update عشان نستدعي الدالة اللي بتعرض القائمة
-    class MockQuery:
-        async def edit_message_text(self, *args, **kwargs):
-            await update.message.reply_text(*args, **kwargs)
-    class MockUpdate:
-        def __init__(self):
-            self.callback_query = MockQuery()
-            
-    await admin_settings_menu(MockUpdate(), context)
+    # نرجع الأدمن لقائمة الإعدادات عشان يشوف التغيير (كرسالة جديدة، مفيش callback هنا)
+    await _render_settings(update.message.reply_text, settings)
     return config.ADMIN_PANEL
 # إدارة المستخدمين
 async def admin_users_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users = database.get_all_users()  # أضفها في database.py
+    users = await db_async.get_all_users()  # أضفها في database.py
     msg = beautify_text(f"👥 عدد المستخدمين: {len(users)}\nاختر مستخدمًا أو ابحث بالاسم/ID.")
     kb = keyboards.admin_user_list_kb(page=0, total_users=len(users), items_per_page=10)
     await update.effective_message.reply_text(msg, reply_markup=kb)
 
 # عرض إحصائيات البوت
 async def admin_stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    stats = database.get_bot_stats()  # أضفها في database.py
+    stats = await db_async.get_bot_stats()  # أضفها في database.py
     msg = beautify_text(f"📊 إحصائيات البوت:\n- المستخدمون: {stats.get('users', 0)}\n- الملخصات: {stats.get('summaries', 0)}\n- أكثر ميزة: {stats.get('top_feature', 'غير محدد')}")
     await update.effective_message.reply_text(msg)
 
@@ -398,25 +432,15 @@ async def admin_settings_handler(update: Update, context: ContextTypes.DEFAULT_T
 
 # سجل العمليات
 async def admin_logs_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logs = database.get_last_logs(10)  # أضفها في database.py
+    logs = await db_async.get_last_logs(10)  # أضفها في database.py
     msg = beautify_text("📝 آخر العمليات:\n" + "\n".join(logs))
     await update.effective_message.reply_text(msg)
 
 # إرسال إشعار جماعي
-async def admin_broadcast_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_broadcast_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.effective_message.reply_text("✍️ أرسل نص الإشعار ليتم إرساله لكل المستخدمين.")
-    context.user_data['admin_broadcast'] = True
-
-async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if context.user_data.get('admin_broadcast'):
-        user_ids = database.get_all_user_ids()
-        for uid in user_ids:
-            try:
-                await context.bot.send_message(uid, beautify_text(update.message.text))
-            except Exception:
-                continue
-        await update.message.reply_text("✅ تم إرسال الإشعار.")
-        context.user_data['admin_broadcast'] = False
+    # النص اللي جاي بيروح لـ do_broadcast عن طريق حالة الـ ConversationHandler
+    return config.ADMIN_BROADCAST_WAIT
 
 # --- Admin DM Wait Handler ---
 async def handle_admin_dm_wait(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -432,222 +456,210 @@ async def handle_admin_dm_wait(update: Update, context: ContextTypes.DEFAULT_TYP
     try:
         await context.bot.send_message(int(target), beautify_text(text))
         await update.message.reply_text("✅ تم إرسال الرسالة.")
-        database.log_admin_action("رسالة خاصة (ID محدد)", f"إلى {target}: {text}")
+        await db_async.log_admin_action("رسالة خاصة (ID محدد)", f"إلى {target}: {text}")
     except Exception:
         await update.message.reply_text("⚠️ تعذر إرسال الرسالة للمستخدم المستهدف.")
     context.user_data.pop('admin_dm_target', None)
     return config.ADMIN_PANEL
 
 # بحث وتعديل مستخدم
-async def admin_search_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_search_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.effective_message.reply_text("🔍 أرسل اسم أو ID المستخدم للبحث.")
-    context.user_data['admin_search'] = True
-
-async def handle_search_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if context.user_data.get('admin_search'):
-        query = update.message.text.strip()
-        user = database.find_user(query)  # أضفها في database.py
-        if user:
-            msg = beautify_text(f"👤 المستخدم: {user['name']}\nID: {user['id']}")
-            await update.message.reply_text(msg, reply_markup=keyboards.admin_user_view_kb(user['id']))
-        else:
-            await update.message.reply_text("❌ لم يتم العثور على المستخدم.")
-        context.user_data['admin_search'] = False
+    return config.ADMIN_SEARCH_WAIT
+
+async def handle_search_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.message.text.strip()
+    user = await db_async.find_user(query)  # أضفها في database.py
+    if user:
+        msg = beautify_text(f"👤 المستخدم: {user['name']}\nID: {user['id']}")
+        await update.message.reply_text(msg, reply_markup=keyboards.admin_user_view_kb(user['id']))
+    else:
+        await update.message.reply_text("❌ لم يتم العثور على المستخدم.")
+    return config.ADMIN_PANEL
 
 # تصدير المستخدمين كـ CSV
+_EXPORT_FIELDS = ("id", "name", "phone_number", "tokens", "files_processed")
+_export_row = operator.itemgetter(*_EXPORT_FIELDS)
+
 async def admin_export_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users = database.get_all_users_detailed()
+    users = await db_async.get_all_users_detailed()
     if not users:
         await update.effective_message.reply_text("لا يوجد مستخدمون للتصدير.")
         return
-    with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.csv', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=["id", "name", "phone_number", "tokens", "files_processed"])
-        writer.writeheader()
-        for u in users:
-            writer.writerow(u)
-        f.flush()
-        f.seek(0)
-        await update.effective_message.reply_document(document=f.name, filename="users_export.csv", caption="📥 تم تصدير المستخدمين بنجاح.")
-    database.log_admin_action("تصدير مستخدمين")
+    # CSV يتبني في الذاكرة: مفيش ملف مؤقت ولا I/O على القرص يوقف الـ event loop
+    buf = io.StringIO()
+    # tuples بدل DictWriter: مفيش lookup للـ fieldnames لكل صف، و writerows بتلف في C
+    writer = csv.writer(buf)
+    writer.writerow(_EXPORT_FIELDS)
+    writer.writerows(map(_export_row, users))
+    data = io.BytesIO(buf.getvalue().encode('utf-8'))
+    await update.effective_message.reply_document(document=data, filename="users_export.csv", caption="📥 تم تصدير المستخدمين بنجاح.")
+    await db_async.log_admin_action("تصدير مستخدمين")
 
 # تفعيل/تعطيل ميزة ذكاء اصطناعي
 async def admin_toggle_ai(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    settings = database.get_settings()
+    settings = await db_async.cached_settings()
     ai_enabled = settings.get("ai_enabled", "1") == "1"
     settings["ai_enabled"] = "0" if ai_enabled else "1"
-    database.save_settings(settings)
+    await db_async.save_settings(settings)
     msg = "✅ تم تفعيل الذكاء الاصطناعي." if not ai_enabled else "❌ تم تعطيله مؤقتًا."
     await update.effective_message.reply_text(msg)
-    database.log_admin_action("تغيير حالة AI", msg)
+    await db_async.log_admin_action("تغيير حالة AI", msg)
 
 # وضع الصيانة
 async def admin_maintenance_mode(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    settings = database.get_settings()
+    settings = await db_async.cached_settings()
     maintenance = settings.get("maintenance", "0") == "1"
     settings["maintenance"] = "0" if maintenance else "1"
-    database.save_settings(settings)
+    await db_async.save_settings(settings)
     msg = "🔧 تم تفعيل وضع الصيانة. لن يتمكن المستخدمون من استخدام البوت." if not maintenance else "✅ تم إنهاء وضع الصيانة."
     await update.effective_message.reply_text(msg)
-    database.log_admin_action("تغيير وضع الصيانة", msg)
+    await db_async.log_admin_action("تغيير وضع الصيانة", msg)
 
 # إرسال مكافأة جماعية
 async def admin_reward_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users = database.get_all_user_ids()
-    for uid in users:
-        user = database._get_user_from_db(uid)
-        if user:
-            user["tokens"] = user.get("tokens", 0) + 100
-            database._update_user_in_db(uid, user)
-            try:
-                await context.bot.send_message(uid, "🎁 تم إضافة 100 نقطة هدية لك من الأدمن!")
-            except Exception:
-                continue
+    # الـ UPDATE شمل كل المستخدمين، فالإشعار بيتبعت للكل بالـ IDs المتدفقة من القاعدة
+    await db_async.bulk_increment_tokens(100)
+    await broadcast(None, lambda uid: context.bot.send_message(uid, _GIFT_MSG))
     await update.effective_message.reply_text("✅ تم إرسال المكافأة لكل المستخدمين.")
-    database.log_admin_action("مكافأة جماعية")
+    await db_async.log_admin_action("مكافأة جماعية")
 
 # مراجعة آخر العمليات
 async def admin_review_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logs = database.get_last_logs(20)
+    logs = await db_async.get_last_logs(20)
     msg = beautify_text("📝 آخر 20 عملية إدارية:\n" + "\n".join(logs))
     await update.effective_message.reply_text(msg)
 
 # جدولة رسالة جماعية
-async def admin_schedule_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_schedule_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.effective_message.reply_text("🕒 أرسل نص الرسالة متبوعًا بوقت الإرسال (مثال: 2025-08-24 15:00:00)")
-    context.user_data['admin_schedule_broadcast'] = True
+    return config.ADMIN_SCHED_WAIT
+
+async def _deliver_scheduled_broadcast(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback: sends a scheduled broadcast, then reports back to the admin who set it."""
+    text = context.job.data["text"]
+    message = beautify_text(text)
+    await broadcast(None, lambda uid: context.bot.send_message(uid, message))
+    await context.bot.send_message(context.job.chat_id, "✅ تم إرسال الرسالة المجدولة.")
+    await db_async.log_admin_action("جدولة بث", text)
+
+async def _background_broadcast(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback: runs a fan-out off the admin's handler, then reports the count back to them."""
+    data = context.job.data
+    sent = await broadcast(None, data["send"])
+    await context.bot.send_message(context.job.chat_id, f"{data['done']} ({sent} مستخدم)")
+    await db_async.log_admin_action(data["action"])
+
+def _start_background_broadcast(context: ContextTypes.DEFAULT_TYPE, chat_id: int, send, done: str, action: str) -> None:
+    # الـ handler بيرجع على طول ولوحة الأدمن تفضل شغالة طول مدة البث
+    context.job_queue.run_once(
+        _background_broadcast, when=0, chat_id=chat_id,
+        data={"send": send, "done": done, "action": action}, name=f"bcast_{action}",
+    )
 
-async def handle_schedule_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if context.user_data.get('admin_schedule_broadcast'):
-        try:
-            text, timestr = update.message.text.rsplit(' ', 1)
-            send_time = datetime.datetime.strptime(timestr, "%Y-%m-%d %H:%M:%S")
-            now = datetime.datetime.now()
-            delay = (send_time - now).total_seconds()
-            if delay < 0:
-                await update.message.reply_text("⚠️ الوقت المدخل قد مضى!")
-                return
-            await update.message.reply_text(f"⏳ سيتم إرسال الرسالة في {send_time}.")
-            await asyncio.sleep(delay)
-            user_ids = database.get_all_user_ids()
-            for uid in user_ids:
-                try:
-                    await context.bot.send_message(uid, beautify_text(text))
-                except Exception:
-                    continue
-            await update.message.reply_text("✅ تم إرسال الرسالة المجدولة.")
-            database.log_admin_action("جدولة بث", text)
-        except Exception:
-            await update.message.reply_text("⚠️ صيغة غير صحيحة. أرسل الرسالة ثم التاريخ والوقت.")
-        context.user_data['admin_schedule_broadcast'] = False
+async def handle_schedule_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    try:
+        # "<نص الرسالة> YYYY-MM-DD HH:MM:SS" — التاريخ والوقت آخر كلمتين
+        text, date_str, time_str = update.message.text.rsplit(' ', 2)
+        send_time = datetime.datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S")
+        now = datetime.datetime.now()
+        delay = (send_time - now).total_seconds()
+        if delay < 0:
+            await update.message.reply_text("⚠️ الوقت المدخل قد مضى!")
+            return config.ADMIN_SCHED_WAIT
+        # الجدولة على الـ JobQueue بدل asyncio.sleep جوه الـ handler
+        context.job_queue.run_once(
+            _deliver_scheduled_broadcast, when=delay, data={"text": text},
+            chat_id=update.effective_chat.id, name=f"bcast_{send_time.isoformat()}"
+        )
+        await update.message.reply_text(f"⏳ سيتم إرسال الرسالة في {send_time}.")
+    except Exception:
+        await update.message.reply_text("⚠️ صيغة غير صحيحة. أرسل الرسالة ثم التاريخ والوقت.")
+    return config.ADMIN_PANEL
 
 # إرسال رسالة لمستخدم محدد
-async def admin_dm_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_dm_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.effective_message.reply_text("✉️ أرسل ID المستخدم ثم الرسالة (مثال: 123456 مرحبًا بك)")
-    context.user_data['admin_dm_user'] = True
+    return config.ADMIN_DM_FREEFORM_WAIT
 
-async def handle_dm_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if context.user_data.get('admin_dm_user'):
-        try:
-            uid, msg = update.message.text.strip().split(' ', 1)
-            await context.bot.send_message(int(uid), beautify_text(msg))
-            await update.message.reply_text("✅ تم إرسال الرسالة.")
-            database.log_admin_action("رسالة خاصة", f"إلى {uid}: {msg}")
-        except Exception:
-            await update.message.reply_text("⚠️ صيغة غير صحيحة. أرسل ID ثم الرسالة.")
-        context.user_data['admin_dm_user'] = False
+async def handle_dm_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    try:
+        uid, msg = update.message.text.strip().split(' ', 1)
+        await context.bot.send_message(int(uid), beautify_text(msg))
+        await update.message.reply_text("✅ تم إرسال الرسالة.")
+        await db_async.log_admin_action("رسالة خاصة", f"إلى {uid}: {msg}")
+    except Exception:
+        await update.message.reply_text("⚠️ صيغة غير صحيحة. أرسل ID ثم الرسالة.")
+    return config.ADMIN_PANEL
 
 # تصدير الإحصائيات كـ CSV
 async def admin_export_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    stats = database.get_bot_stats()
-    with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix='.csv', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        for k, v in stats.items():
-            writer.writerow([k, v])
-        f.flush()
-        f.seek(0)
-        await update.effective_message.reply_document(document=f.name, filename="bot_stats.csv", caption="📊 تم تصدير الإحصائيات.")
-    database.log_admin_action("تصدير إحصائيات")
+    stats = await db_async.get_bot_stats()
+    buf = io.StringIO()
+    csv.writer(buf).writerows(stats.items())
+    data = io.BytesIO(buf.getvalue().encode('utf-8'))
+    await update.effective_message.reply_document(document=data, filename="bot_stats.csv", caption="📊 تم تصدير الإحصائيات.")
+    await db_async.log_admin_action("تصدير إحصائيات")
 
 # إعادة تشغيل البوت (يتطلب دعم خارجي أو إشعار فقط)
 async def admin_restart_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.effective_message.reply_text("🔄 تم إرسال أمر إعادة التشغيل (تأكد من وجود خدمة خارجية تدعم ذلك).")
-    database.log_admin_action("إعادة تشغيل البوت")
+    await db_async.log_admin_action("إعادة تشغيل البوت")
 
 # مراجعة نشاط مستخدم
-async def admin_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.effective_message.reply_text("🔍 أرسل ID المستخدم لمراجعة نشاطه.")
-    context.user_data['admin_user_activity'] = True
-
-async def handle_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if context.user_data.get('admin_user_activity'):
-        uid = update.message.text.strip()
-        user = database._get_user_from_db(int(uid))
-        if user:
-            msg = beautify_text(f"👤 {user['name']}\nID: {user['id']}\nالملفات: {user.get('files_processed', 0)}\nالنقاط: {user.get('tokens', 0)}")
-            await update.message.reply_text(msg)
-            database.log_admin_action("مراجعة نشاط مستخدم", f"{uid}")
-        else:
-            await update.message.reply_text("❌ لم يتم العثور على المستخدم.")
-        context.user_data['admin_user_activity'] = False
+    return config.ADMIN_USER_ACTIVITY_WAIT
+
+async def handle_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    uid = update.message.text.strip()
+    if not uid.isdigit():
+        await update.message.reply_text("⚠️ يرجى إدخال ID رقمي صحيح.")
+        return config.ADMIN_USER_ACTIVITY_WAIT
+    user = await db_async.get_user(int(uid))
+    if user:
+        msg = beautify_text(f"👤 {user['name']}\nID: {user['id']}\nالملفات: {user.get('files_processed', 0)}\nالنقاط: {user.get('tokens', 0)}")
+        await update.message.reply_text(msg)
+        await db_async.log_admin_action("مراجعة نشاط مستخدم", f"{uid}")
+    else:
+        await update.message.reply_text("❌ لم يتم العثور على المستخدم.")
+    return config.ADMIN_PANEL
 
 # إرسال اقتراح ميزة للمستخدمين
-async def admin_suggest_feature(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def admin_suggest_feature(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.effective_message.reply_text("💡 أرسل نص الميزة المقترحة ليتم إرسالها لكل المستخدمين للتصويت.")
-    context.user_data['admin_suggest_feature'] = True
-
-async def handle_suggest_feature(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if context.user_data.get('admin_suggest_feature'):
-        text = update.message.text.strip()
-        user_ids = database.get_all_user_ids()
-        for uid in user_ids:
-            try:
-                await context.bot.send_poll(uid, "ما رأيك في الميزة الجديدة؟", ["ممتازة!", "جيدة", "لا أحتاجها"], explanation=text)
-            except Exception:
-                continue
-        await update.message.reply_text("✅ تم إرسال الاقتراح.")
-        database.log_admin_action("اقتراح ميزة", text)
-        context.user_data['admin_suggest_feature'] = False
+    return config.ADMIN_SUGGEST_WAIT
+
+async def handle_suggest_feature(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    text = update.message.text.strip()
+    await broadcast(None, lambda uid: context.bot.send_poll(uid, _POLL_QUESTION, _POLL_OPTIONS, explanation=text))
+    await update.message.reply_text("✅ تم إرسال الاقتراح.")
+    await db_async.log_admin_action("اقتراح ميزة", text)
+    return config.ADMIN_PANEL
 
 # نظام شارات وجوائز تلقائي
 async def admin_award_badges(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users = database.get_all_users_detailed()
-    top_users = sorted(users, key=lambda u: u.get('files_processed', 0), reverse=True)[:5]
+    top_users = await db_async.get_top_users_by_files(5)
     badges = ["🏆 بطل الأسبوع", "🥇 الأكثر نشاطًا", "🥈 ثاني أكثر نشاط", "🥉 ثالث أكثر نشاط", "⭐ نجم الأسبوع"]
-    for i, user in enumerate(top_users):
-        try:
-            await context.bot.send_message(user['id'], f"{badges[i]}! مبروك لك على نشاطك 🎉")
-        except Exception:
-            continue
+    texts = {user['id']: f"{badges[i]}! مبروك لك على نشاطك 🎉" for i, user in enumerate(top_users)}
+    await broadcast(list(texts), lambda uid: context.bot.send_message(uid, texts[uid]))
     await update.effective_message.reply_text("✅ تم منح الشارات للأكثر تفاعلًا.")
-    database.log_admin_action("منح شارات")
+    await db_async.log_admin_action("منح شارات")
 
 # إرسال تقرير أسبوعي تلقائي
 async def admin_weekly_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    stats = database.get_bot_stats()
-    users = database.get_all_users_detailed()
+    stats = await db_async.get_bot_stats()
     msg = beautify_text(f"📈 تقرير أسبوعي:\n- المستخدمون: {stats.get('users', 0)}\n- الملخصات: {stats.get('summaries', 0)}\n- أكثر ميزة: {stats.get('top_feature', 'غير محدد')}")
-    for u in users:
-        try:
-            await context.bot.send_message(u['id'], msg)
-        except Exception:
-            continue
+    await broadcast(None, lambda uid: context.bot.send_message(uid, msg))
     await update.effective_message.reply_text("✅ تم إرسال التقرير الأسبوعي.")
-    database.log_admin_action("تقرير أسبوعي")
+    await db_async.log_admin_action("تقرير أسبوعي")
 
 # تفعيل الوضع الليلي للمستخدمين
 async def admin_toggle_night_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users = database.get_all_user_ids()
-    for uid in users:
-        user = database._get_user_from_db(uid)
-        if user:
-            user['session']['night_mode'] = not user['session'].get('night_mode', False)
-            database._update_user_in_db(uid, user)
-            try:
-                await context.bot.send_message(uid, "🌙 تم تفعيل الوضع الليلي! استمتع بتجربة أهدأ.")
-            except Exception:
-                continue
+    await db_async.bulk_toggle_night_mode()
+    await broadcast(None, lambda uid: context.bot.send_message(uid, _NIGHT_MODE_MSG))
     await update.effective_message.reply_text("✅ تم تفعيل الوضع الليلي لكل المستخدمين.")
-    database.log_admin_action("تفعيل الوضع الليلي")
+    await db_async.log_admin_action("تفعيل الوضع الليلي")
 
 # إرسال رسالة ترحيب متحركة (GIF)
 async def admin_credit_sub_apply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -666,16 +678,13 @@ async def admin_credit_sub_apply(update: Update, context: ContextTypes.DEFAULT_T
             await update.message.reply_text(f"⚠️ كود الباقة '{package_key}' غير صحيح.")
             return config.ADMIN_CREDIT_SUB_WAIT
 
-        target_user = database._get_user_from_db(user_id)
+        # تطبيق المميزات في UPDATE ذري واحد (بيرجع None لو المستخدم مش موجود)
+        async with user_row_guard(update, context, user_id):
+            target_user = await db_async.credit_subscription(user_id, package["tokens"], package["file_limit"])
         if not target_user:
             await update.message.reply_text(f"⚠️ المستخدم صاحب الـ ID `{user_id}` غير موجود.")
             return config.ADMIN_CREDIT_SUB_WAIT
 
-        # تطبيق المميزات
-        target_user["tokens"] += package["tokens"]
-        target_user["subscription_limit"] += package["file_limit"]
-        database._update_user_in_db(user_id, target_user)
-
         # إشعار الأدمن بالنجاح
         await update.message.reply_text(
             f"✅ تم تفعيل **{package['name']}** للمستخدم {target_user['name']} (`{user_id}`) بنجاح."
@@ -732,22 +741,20 @@ async def admin_activate_sub_from_button(update: Update, context: ContextTypes.D
 
         # Retrieve package and user details from config and database.
         package = config.SUBSCRIPTION_PACKAGES.get(package_key)
-        target_user = database._get_user_from_db(user_id)
 
         # Handle potential errors gracefully.
         if not package:
             await query.edit_message_text(f"❌ خطأ فادح: الباقة '{package_key}' لم تعد موجودة في الإعدادات.")
             return
 
+        # --- Core Logic: Apply the subscription benefits ---
+        # One atomic UPDATE; a double-clicked button can't lose one of the credits.
+        async with user_row_guard(update, context, user_id):
+            target_user = await db_async.credit_subscription(user_id, package["tokens"], package["file_limit"])
         if not target_user:
             await query.edit_message_text(f"❌ خطأ فادح: المستخدم صاحب الـ ID `{user_id}` غير موجود في قاعدة البيانات.")
             return
 
-        # --- Core Logic: Apply the subscription benefits ---
-        target_user["tokens"] = target_user.get("tokens", 0) + package["tokens"]
-        target_user["subscription_limit"] = target_user.get("subscription_limit", 0) + package["file_limit"]
-        database._update_user_in_db(user_id, target_user)
-
         # --- Feedback to the Admin ---
         # Edit the original notification message to confirm the action.
         await query.edit_message_text(
@@ -783,43 +790,60 @@ async def admin_activate_sub_from_button(update: Update, context: ContextTypes.D
             await query.edit_message_text("❌ حدث خطأ فني غير متوقع أثناء محاولة تفعيل الاشتراك.")
         except Exception:
             pass # Ignore if the original message is gone or can't be edited
-async def admin_send_welcome_gif(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users = database.get_all_user_ids()
-    for uid in users:
+async def _get_welcome_file_id(bot, chat_id: int) -> Optional[str]:
+    """file_id الخاص بـ welcome.gif: من الإعدادات لو اترفع قبل كده، وإلا بيترفع مرة ويتحفظ.
+    المعاينة اللي بتتبعت لـ chat_id بتتأكد إن الـ file_id لسه صالح قبل البث."""
+    settings = await db_async.cached_settings()
+    file_id = settings.get("welcome_gif_file_id")
+    if file_id:
         try:
-            with open("welcome.gif", "rb") as gif:
-                await context.bot.send_animation(uid, gif, caption="👋 مرحبًا بك في أقوى بوت تعليمي!")
-        except Exception:
-            continue
-    await update.effective_message.reply_text("✅ تم إرسال رسالة ترحيب متحركة.")
-    database.log_admin_action("ترحيب متحرك")
+            await bot.send_animation(chat_id, file_id, caption=_WELCOME_CAPTION)
+            return file_id
+        except BadRequest:
+            pass  # الـ file_id اتلغى عند Telegram؛ نرفع من جديد
+    try:
+        animation = await asyncio.to_thread(pathlib.Path("welcome.gif").read_bytes)
+    except OSError:
+        return None
+    preview = await bot.send_animation(chat_id, animation, caption=_WELCOME_CAPTION)
+    file_id = preview.animation.file_id
+    await db_async.save_settings({"welcome_gif_file_id": file_id})
+    return file_id
+
+async def admin_send_welcome_gif(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # البث بالـ file_id المحفوظ: مفيش قراءة من القرص ولا رفع للـ GIF لكل مستخدم
+    bot = context.bot
+    file_id = await _get_welcome_file_id(bot, update.effective_chat.id)
+    if file_id is None:
+        await update.effective_message.reply_text("⚠️ ملف welcome.gif غير موجود.")
+        return
+    _start_background_broadcast(
+        context, update.effective_chat.id,
+        lambda uid: bot.send_animation(uid, file_id, caption=_WELCOME_CAPTION),
+        "✅ تم إرسال رسالة ترحيب متحركة.", "ترحيب متحرك",
+    )
+    await update.effective_message.reply_text("⏳ جاري إرسال رسالة الترحيب في الخلفية...")
 
 # مراجعة أكثر المستخدمين تفاعلاً
 async def admin_top_active_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    users = database.get_all_users_detailed()
-    top_users = sorted(users, key=lambda u: u.get('files_processed', 0), reverse=True)[:10]
+    top_users = await db_async.get_top_users_by_files(10)
     msg = beautify_text("🔥 أكثر 10 مستخدمين تفاعلاً:\n" + "\n".join([f"{i+1}. {u['name']} - {u.get('files_processed', 0)} ملف" for i, u in enumerate(top_users)]))
     await update.effective_message.reply_text(msg)
-    database.log_admin_action("مراجعة الأكثر تفاعلاً")
+    await db_async.log_admin_action("مراجعة الأكثر تفاعلاً")
 
 # إرسال اقتباس يومي تلقائي
 async def admin_daily_quote(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    quotes = [
-        "💡 العلم نور، والجهل ظلام.",
-        "🚀 لا يوجد مستحيل مع الإرادة.",
-        "📚 المذاكرة طريق النجاح.",
-        "🌟 كل يوم فرصة جديدة للتعلم.",
-        "🧠 الذكاء في الاستمرار، لا في البداية فقط."
-    ]
-    quote = random.choice(quotes)
-    users = database.get_all_user_ids()
-    for uid in users:
-        try:
-            await context.bot.send_message(uid, quote)
-        except Exception:
-            continue
-    await update.effective_message.reply_text("✅ تم إرسال اقتباس يومي.")
-    database.log_admin_action("اقتباس يومي")
+    quote = random.choice(_DAILY_QUOTES)
+    # يتبعت مرة للأدمن (معاينة)، وبعدين copy_message لكل مستخدم: Telegram بينسخ الرسالة من عنده
+    bot = context.bot
+    chat_id = update.effective_chat.id
+    preview = await bot.send_message(chat_id, quote)
+    _start_background_broadcast(
+        context, chat_id,
+        lambda uid: bot.copy_message(uid, chat_id, preview.message_id),
+        "✅ تم إرسال اقتباس يومي.", "اقتباس يومي",
+    )
+    await update.effective_message.reply_text("⏳ جاري إرسال الاقتباس في الخلفية...")
 async def handle_admin_pick_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Accept a user ID after pressing admin_pick_user_by_id and show user controls."""
     raw = (update.message.text or '').strip()
@@ -827,7 +851,7 @@ async def handle_admin_pick_user(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("⚠️ أدخل ID رقمي صحيح.")
         return config.ADMIN_PICK_USER
     uid = int(raw)
-    user = database._get_user_from_db(uid)
+    user = await db_async.get_user(uid)
     if not user:
         await update.message.reply_text("❌ لم يتم العثور على المستخدم.")
         return config.ADMIN_PICK_USER
@@ -849,3 +873,21 @@ async def admin_exit_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # إنهاء محادثة الأدمن الحالية
     return ConversationHandler.END
+
+
+# أزرار اللوحة اللي بتعرض شاشة وترجع لنفس الحالة (معرّفة هنا بعد تعريف كل الدوال)
+_PANEL_ACTIONS = {
+    "admin_stats": admin_stats_handler,
+    "admin_reports": admin_logs_handler,
+    "admin_export_users": admin_export_users,
+    "admin_test_all": admin_test_all_buttons,
+    "admin_users": admin_users_list,
+    "admin_settings": admin_settings_menu,
+    "admin_dm_start": admin_dm_user,
+    # دول بيرجعوا حالة انتظار النص بتاعتهم
+    "admin_search_user": admin_search_user,
+    "admin_user_activity": admin_user_activity,
+    "admin_schedule_broadcast": admin_schedule_broadcast,
+    "admin_suggest_feature": admin_suggest_feature,
+    "back_main": admin_exit_to_main,  # بترجع ConversationHandler.END
+}
@@ -1,12 +1,19 @@
 # handlers/common_handlers.py
+from collections import OrderedDict
+import asyncio
 from contextlib import suppress
+from functools import lru_cache
+import inspect
 import logging
+import os
+import uuid
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
 import random
 import io
+import time
 import base64
 import re
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
@@ -15,6 +22,8 @@ from datetime import datetime
 import shutil
 
 import database
+import db_async
+from broadcast import broadcast
 import keyboards
 import config
 from utils import safe_md, beautify_text, add_library_item, now_iso
@@ -24,48 +33,69 @@ def _admin_ids():
     return getattr(config, 'ADMIN_IDS', getattr(config, 'ADMIN_USER_IDS', []))
 
 # --- Simple text→image helper (centered text, auto-wrap naive) ---
+@lru_cache(maxsize=4)
+def _grad_bg(w: int, h: int) -> Image.Image:
+    """Vertical card gradient. Cached per size; callers must .copy() before drawing on it."""
+    top = (37, 56, 149)
+    bottom = (14, 23, 63)
+    column = []
+    for y in range(h):
+        ratio = y / max(h - 1, 1)
+        column.append((
+            int(top[0] * (1 - ratio) + bottom[0] * ratio),
+            int(top[1] * (1 - ratio) + bottom[1] * ratio),
+            int(top[2] * (1 - ratio) + bottom[2] * ratio),
+            255,
+        ))
+    # عمود بعرض بكسل واحد ويتمدّ أفقيًا في C، بدل draw.line لكل سطر
+    strip = Image.new('RGBA', (1, h))
+    strip.putdata(column)
+    return strip.resize((w, h), Image.NEAREST)
+
+@lru_cache(maxsize=4)
+def _card_shadow(card_w: int, card_h: int) -> Image.Image:
+    """Blurred drop shadow for a card of this size. Cached: only ever read (alpha_composite source)."""
+    shadow = Image.new('RGBA', (card_w + 60, card_h + 60), (0, 0, 0, 0))
+    shadow_draw = ImageDraw.Draw(shadow)
+    shadow_draw.rounded_rectangle((30, 30, card_w + 30, card_h + 30), radius=48, fill=(0, 0, 0, 110))
+    return shadow.filter(ImageFilter.GaussianBlur(24))
+
+# بدايات السطور اللي بتترسم كـ bullet في الكارت — regex واحد بدل startswith لكل prefix
+_CARD_BULLET_PREFIXES = ('- ', '• ', '▪', '· ', '— ', '– ', '* ', '❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌')
+_CARD_BULLET_RE = re.compile('|'.join(map(re.escape, _CARD_BULLET_PREFIXES)))
+_CARD_EMOJI = frozenset({'❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌'})
+
+_FONT_CANDIDATES_MAIN = (
+    '/System/Library/Fonts/Supplemental/Arial Unicode.ttf',
+    '/System/Library/Fonts/Supplemental/GeezaPro.ttf',
+    '/System/Library/Fonts/SFNSRounded.ttf',
+    '/Library/Fonts/Arial Unicode.ttf',
+    '/usr/share/fonts/truetype/noto/NotoSansArabic-Regular.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+_FONT_CANDIDATES_TITLE = (
+    '/System/Library/Fonts/SFNSDisplay.ttf',
+    '/System/Library/Fonts/Supplemental/Al Bayan.ttc',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
+)
+
+@lru_cache(maxsize=32)
+def _load_font(candidates: Tuple[str, ...], size: int) -> ImageFont.FreeTypeFont:
+    """First loadable font from `candidates` — parsed once per (candidates, size) and reused across cards."""
+    for path in candidates:
+        try:
+            return ImageFont.truetype(path, size)
+        except Exception:
+            continue
+    return ImageFont.load_default()
+
 def _text_to_image(lines: List[str], width: int = 1080, height: int = 1350) -> io.BytesIO:
     """Render a rich study card image from plain text lines."""
 
-    def _grad_bg(w: int, h: int) -> Image.Image:
-        top = (37, 56, 149)
-        bottom = (14, 23, 63)
-        bg = Image.new('RGBA', (w, h))
-        draw_bg = ImageDraw.Draw(bg)
-        for y in range(h):
-            ratio = y / max(h - 1, 1)
-            r = int(top[0] * (1 - ratio) + bottom[0] * ratio)
-            g = int(top[1] * (1 - ratio) + bottom[1] * ratio)
-            b = int(top[2] * (1 - ratio) + bottom[2] * ratio)
-            draw_bg.line([(0, y), (w, y)], fill=(r, g, b, 255))
-        return bg
-
-    def _load_font(candidates: List[str], size: int) -> ImageFont.FreeTypeFont:
-        for path in candidates:
-            try:
-                return ImageFont.truetype(path, size)
-            except Exception:
-                continue
-        return ImageFont.load_default()
-
-    font_candidates_main = [
-        '/System/Library/Fonts/Supplemental/Arial Unicode.ttf',
-        '/System/Library/Fonts/Supplemental/GeezaPro.ttf',
-        '/System/Library/Fonts/SFNSRounded.ttf',
-        '/Library/Fonts/Arial Unicode.ttf',
-        '/usr/share/fonts/truetype/noto/NotoSansArabic-Regular.ttf',
-        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
-    ]
-    font_candidates_title = [
-        '/System/Library/Fonts/SFNSDisplay.ttf',
-        '/System/Library/Fonts/Supplemental/Al Bayan.ttc',
-        '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'
-    ]
-
-    title_font = _load_font(font_candidates_title, 64)
-    lead_font = _load_font(font_candidates_title, 28)
-    body_font = _load_font(font_candidates_main, 36)
-    meta_font = _load_font(font_candidates_main, 28)
+    title_font = _load_font(_FONT_CANDIDATES_TITLE, 64)
+    lead_font = _load_font(_FONT_CANDIDATES_TITLE, 28)
+    body_font = _load_font(_FONT_CANDIDATES_MAIN, 36)
+    meta_font = _load_font(_FONT_CANDIDATES_MAIN, 28)
 
     cleaned = [str(line or '').strip() for line in lines if str(line or '').strip()]
     card_title = "Smart Study Snapshot"
@@ -80,7 +110,7 @@ def _text_to_image(lines: List[str], width: int = 1080, height: int = 1350) -> i
     if not cleaned:
         cleaned = [card_title]
 
-    bg = _grad_bg(width, height)
+    bg = _grad_bg(width, height).copy()
 
     margin = 90
     card_w = width - margin * 2
@@ -88,11 +118,8 @@ def _text_to_image(lines: List[str], width: int = 1080, height: int = 1350) -> i
     card = Image.new('RGBA', (card_w, card_h), (255, 255, 255, 235))
     card_draw = ImageDraw.Draw(card)
 
-    shadow = Image.new('RGBA', (card_w + 60, card_h + 60), (0, 0, 0, 0))
-    shadow_draw = ImageDraw.Draw(shadow)
-    shadow_draw.rounded_rectangle((30, 30, card_w + 30, card_h + 30), radius=48, fill=(0, 0, 0, 110))
-    shadow = shadow.filter(ImageFilter.GaussianBlur(24))
-    bg.alpha_composite(shadow, (margin - 30, margin - 30))
+    # الظل ثابت لنفس مقاس الكارت، فالـ GaussianBlur بيتحسب مرة واحدة بس
+    bg.alpha_composite(_card_shadow(card_w, card_h), (margin - 30, margin - 30))
 
     card_draw.rounded_rectangle((0, 0, card_w, card_h), radius=44, fill=(255, 255, 255, 240))
 
@@ -116,32 +143,48 @@ def _text_to_image(lines: List[str], width: int = 1080, height: int = 1350) -> i
         words = line.split()
         if not words:
             return ['']
+        # كل كلمة بتتقاس مرة واحدة والسطر بيتجمع بالجمع التراكمي؛ القياس الكامل للسطر
+        # بس لما التقدير يقرب من الحد (kerning/shaping ممكن يغيّر العرض شوية)
+        space_w = font.getlength(' ')
+        widths = [font.getlength(word) for word in words]
+        slack = font.size / 4
         wrapped: List[str] = []
-        current = words[0]
-        for word in words[1:]:
-            candidate = f"{current} {word}"
-            if font.getlength(candidate) <= limit:
-                current = candidate
+        start = 0
+        current_w = widths[0]
+        for i in range(1, len(words)):
+            estimate = current_w + space_w + widths[i]
+            if estimate <= limit - slack:
+                fits = True
+            elif estimate > limit + slack:
+                fits = False
+            else:
+                fits = font.getlength(' '.join(words[start:i + 1])) <= limit
+            if fits:
+                current_w = estimate
             else:
-                wrapped.append(current)
-                current = word
-        wrapped.append(current)
+                wrapped.append(' '.join(words[start:i]))
+                start = i
+                current_w = widths[i]
+        wrapped.append(' '.join(words[start:]))
         return wrapped
 
     def is_bullet(text_line: str) -> bool:
-        stripped_line = text_line.lstrip()
-        prefixes = ('- ', '• ', '▪', '· ', '— ', '– ', '* ', '❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌')
-        return any(stripped_line.startswith(prefix) for prefix in prefixes)
+        return _CARD_BULLET_RE.match(text_line.lstrip()) is not None
 
+    # ثوابت اللوب متحسوبة مرة واحدة (والـ bound method) بدل attribute lookup مع كل سطر
+    draw_text = card_draw.text
+    line_step = body_font.size + 12
+    blank_step = int(body_font.size * 0.8)
+    text_bottom = card_h - 100
     y_cursor = body_start_y
     for raw in cleaned:
         if not raw.strip():
-            y_cursor += int(body_font.size * 0.8)
+            y_cursor += blank_step
             continue
 
         bullet = is_bullet(raw)
         text_line = raw.lstrip('-•▪·—–* ')
-        if bullet and len(raw) >= 2 and raw.strip()[0] in {'❓', '✅', '⚠️', '🔥', '🎯', '🧠', '🧪', '🚀', '📌'}:
+        if bullet and len(raw) >= 2 and raw.strip()[0] in _CARD_EMOJI:
             emoji = raw.strip()[0]
             text_line = raw.strip()[2:].lstrip()
         else:
@@ -149,21 +192,21 @@ def _text_to_image(lines: List[str], width: int = 1080, height: int = 1350) -> i
 
         pieces = wrap_text(text_line, body_font, max_text_width if not bullet else max_text_width - bullet_indent)
         for idx, piece in enumerate(pieces):
-            if y_cursor > card_h - 100:
+            if y_cursor > text_bottom:
                 break
             x_pos = text_left
             if bullet:
                 if idx == 0:
                     if emoji:
-                        card_draw.text((x_pos, y_cursor), emoji, font=body_font, fill=accent_color)
+                        draw_text((x_pos, y_cursor), emoji, font=body_font, fill=accent_color)
                     else:
                         card_draw.ellipse((x_pos, y_cursor + 14, x_pos + 12, y_cursor + 26), fill=accent_color)
                     x_pos += bullet_indent
                 else:
                     x_pos += bullet_indent
-            card_draw.text((x_pos, y_cursor), piece, font=body_font, fill=body_color)
-            y_cursor += body_font.size + 12
-        if y_cursor > card_h - 100:
+            draw_text((x_pos, y_cursor), piece, font=body_font, fill=body_color)
+            y_cursor += line_step
+        if y_cursor > text_bottom:
             break
         y_cursor += 8
 
@@ -173,7 +216,8 @@ def _text_to_image(lines: List[str], width: int = 1080, height: int = 1350) -> i
 
     final_img = composed.convert('RGB')
     bio = io.BytesIO()
-    final_img.save(bio, format='PNG', optimize=True)
+    # zlib أسرع مستوى: الكارت بيتبعت على طول وTelegram بيعيد ضغطه كـ photo، فالـ optimize كان وقت ضايع
+    final_img.save(bio, format='PNG', compress_level=1)
     bio.seek(0)
     return bio
 
@@ -191,7 +235,7 @@ from ai_services import (
 )
 from file_generator import (
     build_pdf_from_lines_weasy as build_stylish_pdf,
-    build_dual_language_pdf,
+    build_dual_language_pdf_async,
     build_text_to_pdf
 )
 from telegraph_utils import publish_bilingual_to_telegraph, publish_lines_to_telegraph
@@ -204,15 +248,34 @@ logger = logging.getLogger(__name__)
 # ==================================
 from functools import wraps
 
+# اشتراكات مؤكدة: (user_id, channel) -> وقت انتهاء الصلاحية. النتيجة السلبية ما بتتخزنش،
+# فاللي لسه مشترك حالًا بيعدي على طول من غير ما يستنى الكاش يخلص
+_SUB_CACHE_TTL = 300.0
+_SUB_CACHE_MAX = 100_000
+_sub_cache: "OrderedDict[Tuple[int, str], float]" = OrderedDict()
+
 async def is_user_subscribed(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    settings = database.get_settings()
+    settings = await db_async.cached_settings()
     channel = settings.get("force_sub_channel")
     if not channel:
         return True # Bypass if no channel is set
 
+    key = (user_id, channel)
+    expires = _sub_cache.get(key)
+    if expires is not None:
+        if expires > time.monotonic():
+            _sub_cache.move_to_end(key)
+            return True
+        del _sub_cache[key]
+
     try:
         member = await context.bot.get_chat_member(chat_id=channel, user_id=user_id)
-        return member.status in ['creator', 'administrator', 'member']
+        subscribed = member.status in ['creator', 'administrator', 'member']
+        if subscribed:
+            _sub_cache[key] = time.monotonic() + _SUB_CACHE_TTL
+            if len(_sub_cache) > _SUB_CACHE_MAX:
+                _sub_cache.popitem(last=False)
+        return subscribed
     except BadRequest as e:
         if "user not found" in str(e).lower(): return False
         if "chat not found" in str(e).lower():
@@ -307,9 +370,7 @@ async def contact_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.effective_message.reply_text("من فضلك، شارك جهة الاتصال الخاصة بك فقط.")
         return config.WAITING_INPUT
 
-    user = database.ensure_user(user_id, update.effective_user.full_name)
-    user['phone_number'] = contact.phone_number
-    database._update_user_in_db(user_id, user)
+    await db_async.set_user_phone(user_id, update.effective_user.full_name, contact.phone_number)
 
     await update.effective_message.reply_text(
         "✅ شكرًا لك! تم التحقق بنجاح.", reply_markup=ReplyKeyboardRemove()
@@ -366,7 +427,9 @@ async def _make_pdf_and_prompt_download(
     telegraph_url = None
     if pdf_builder:
         builder_kwargs = builder_kwargs or {}
-        pdf_bytes, pdf_fname = pdf_builder(title=title, author_username=bot_username, **builder_kwargs)
+        built = pdf_builder(title=title, author_username=bot_username, **builder_kwargs)
+        # async builders render in the PDF worker pool without blocking the event loop
+        pdf_bytes, pdf_fname = (await built) if inspect.isawaitable(built) else built
     else:
         # Normalize bullets for better readability in both PDF and Telegraph
         normalized_text = _explode_inline_bullets("\n".join(lines))
@@ -380,14 +443,21 @@ async def _make_pdf_and_prompt_download(
                 user.setdefault('session', {})[f'link_{session_key}'] = telegraph_url
         except Exception as exc:
             logger.debug(f"Telegraph publish failed (non-blocking): {exc}")
-    pdf_b64 = base64.b64encode(pdf_bytes.getvalue()).decode('utf-8')
-    user['session'][f'file_{session_key}'] = {'pdf': {'data': pdf_b64, 'fname': pdf_fname}}
+    # الملف نفسه على الديسك، والجلسة فيها المسار بس (بدل base64 جوه JSON المستخدم)
+    old_pdf = (user['session'].get(f'file_{session_key}') or {}).get('pdf') or {}
+    pdf_path = await asyncio.to_thread(_cache_pdf, pdf_bytes)
+    user['session'][f'file_{session_key}'] = {'pdf': {'path': pdf_path, 'fname': pdf_fname}}
+    if old_pdf.get('path'):
+        with suppress(OSError):
+            os.remove(old_pdf['path'])
     database._update_user_in_db(user['id'], user)
     if send_direct:
         # Clean the previous UI and send the document directly
         with suppress(Exception):
             await query.message.delete()
         try:
+            # نفس الـbuffer اللي اتكتب منه الملف؛ نرجع لأوله بدل نسخة جديدة
+            pdf_bytes.seek(0)
             await context.bot.send_document(chat_id=user['id'], document=pdf_bytes, filename=pdf_fname, caption=f"✅ {title}")
         except Exception as e:
             logger.error(f"Failed to send document directly: {e}")
@@ -514,18 +584,60 @@ def _get_library_item(user: dict, item_id: str) -> Optional[dict]:
     return user.get('library', {}).get('items', {}).get(item_id)
 
 
+def _cache_pdf(pdf_bytes: io.BytesIO) -> str:
+    """Write a generated PDF to PDF_CACHE_DIR and return its path."""
+    os.makedirs(config.PDF_CACHE_DIR, exist_ok=True)
+    path = os.path.join(config.PDF_CACHE_DIR, f"{uuid.uuid4().hex}.pdf")
+    with open(path, 'wb') as fh:
+        fh.write(pdf_bytes.getbuffer())
+    return path
+
+
+def _sweep_pdf_cache_sync(max_age: float) -> int:
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = os.scandir(config.PDF_CACHE_DIR)
+    except FileNotFoundError:
+        return 0
+    with entries:
+        for entry in entries:
+            with suppress(OSError):
+                if entry.name.endswith('.pdf') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+    return removed
+
+
+async def sweep_pdf_cache(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback: delete cached PDFs older than PDF_CACHE_TTL_HOURS (reset/expired sessions)."""
+    removed = await asyncio.to_thread(_sweep_pdf_cache_sync, config.PDF_CACHE_TTL_HOURS * 3600)
+    if removed:
+        logger.info("PDF cache sweep removed %d file(s)", removed)
+
+
 async def _send_saved_pdf(context: ContextTypes.DEFAULT_TYPE, user: dict, session_key: str) -> bool:
     entry = user.get('session', {}).get(f'file_{session_key}', {})
     pdf = entry.get('pdf') if isinstance(entry, dict) else None
-    if not pdf or not pdf.get('data'):
+    if not pdf:
+        return False
+    fname = pdf.get('fname', 'document.pdf')
+    if pdf.get('path'):
+        try:
+            fh = open(pdf['path'], 'rb')
+        except OSError:
+            return False
+        with fh:
+            await context.bot.send_document(chat_id=user['id'], document=fh, filename=fname, caption="✅ تم التحميل.")
+        return True
+    # جلسات قديمة كانت بتخزن الملف base64
+    if not pdf.get('data'):
         return False
     try:
         raw = base64.b64decode(pdf['data'])
     except Exception:
         return False
-    bio = io.BytesIO(raw)
-    bio.name = pdf.get('fname', 'document.pdf')
-    await context.bot.send_document(chat_id=user['id'], document=bio, filename=bio.name, caption="✅ تم التحميل.")
+    await context.bot.send_document(chat_id=user['id'], document=raw, filename=fname, caption="✅ تم التحميل.")
     return True
 
 
@@ -853,7 +965,7 @@ async def _run_ai_feature(
     if feature_key == 'dual_translation':
         segments = _extract_dual_segments(result_text)
         if segments:
-            pdf_builder = build_dual_language_pdf
+            pdf_builder = build_dual_language_pdf_async
             # Merge AI-provided glossary (if any) with locally detected terms
             ai_gloss = extract_glossary_json(result_text) or []
             def _seg_eng(seg):
@@ -1228,12 +1340,12 @@ async def features_callback_router(update: Update, context: ContextTypes.DEFAULT
 
     if data in ('feature_leaderboard', 'feature_top10'):
         try:
-            users = database.get_all_users_detailed()
+            # الترتيب والـ LIMIT جوه SQLite بدل تحميل كل المستخدمين وترتيبهم هنا
+            ranked = await db_async.get_top_users_by_files(10)
         except Exception as exc:
             logger.error(f"Failed to fetch leaderboard: {exc}")
             await query.message.reply_text('⚠️ تعذر تحميل لوحة الصدارة الآن.')
             return
-        ranked = sorted(users, key=lambda u: u.get('files_processed', 0), reverse=True)[:10]
         if not ranked:
             await query.message.reply_text('لا يوجد نشاط كافٍ لعرض لوحة الصدارة حتى الآن.')
             return
@@ -1335,28 +1447,16 @@ async def features_callback_router(update: Update, context: ContextTypes.DEFAULT
     await query.message.reply_text('🚧 هذه الميزة قيد التطوير حالياً.')
 
 async def download_pdf_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Sends a previously prepared PDF stored in the user's session (base64)."""
+    """Sends a previously prepared PDF referenced from the user's session."""
     query = update.callback_query
     await query.answer()
     user = database.ensure_user(query.from_user.id, query.from_user.full_name)
     data = query.data  # e.g., download_pdf_prod_sum
     try:
         key = data.replace('download_pdf_', '', 1)
-        entry = user.get('session', {}).get(f'file_{key}', {})
-        pdf = entry.get('pdf') if isinstance(entry, dict) else None
-        if not pdf or not pdf.get('data'):
+        if not await _send_saved_pdf(context, user, key):
             await query.edit_message_text("⚠️ لم أجد الملف المطلوب أو انتهت صلاحيته.")
             return
-        import base64, io
-        raw = base64.b64decode(pdf['data'])
-        bio = io.BytesIO(raw)
-        bio.name = pdf.get('fname', 'document.pdf')
-        await context.bot.send_document(
-            chat_id=user['id'],
-            document=bio,
-            filename=bio.name,
-            caption="✅ تم التحميل."
-        )
     except Exception as e:
         logger.exception("Failed to send stored PDF")
         await query.edit_message_text("⚠️ حدث خطأ أثناء تجهيز الملف.")
@@ -1395,18 +1495,11 @@ async def route_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # Admin broadcast text
     if mode == 'broadcast_waiting_text':
-        # TODO: Replace with real DB users iteration
+        # نفس مسار البث بتاع لوحة الأدمن: IDs متدفقة من القاعدة على دفعات + rate limit
         try:
-            users = [u['id'] for u in database.get_all_users_detailed()]
+            sent = await broadcast(None, lambda uid: context.bot.send_message(chat_id=uid, text=text))
         except Exception:
-            users = []
-        sent = 0
-        for uid in users:
-            try:
-                await context.bot.send_message(chat_id=uid, text=text)
-                sent += 1
-            except Exception:
-                pass
+            sent = 0
         await update.effective_message.reply_text(f"تم إرسال البث إلى {sent} مستخدم.")
         context.user_data['mode'] = None
         return
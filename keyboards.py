@@ -302,7 +302,9 @@ def admin_panel_kb() -> InlineKeyboardMarkup:
         [InlineKeyboardButton("📊 إحصائيات", callback_data="admin_stats"), InlineKeyboardButton("🚨 البلاغات", callback_data="admin_reports")],
         [InlineKeyboardButton("📢 بث رسالة", callback_data="admin_broadcast"), InlineKeyboardButton("📤 تصدير المستخدمين", callback_data="admin_export_users")],
         [InlineKeyboardButton("👥 إدارة المستخدمين", callback_data="admin_users")],
+        [InlineKeyboardButton("🔍 بحث عن مستخدم", callback_data="admin_search_user"), InlineKeyboardButton("📈 نشاط مستخدم", callback_data="admin_user_activity")],
         [InlineKeyboardButton("💬 إرسال رسالة خاصة", callback_data="admin_dm_start")],
+        [InlineKeyboardButton("🕒 جدولة بث", callback_data="admin_schedule_broadcast"), InlineKeyboardButton("💡 اقتراح ميزة", callback_data="admin_suggest_feature")],
         [InlineKeyboardButton("⚙️ إعدادات البوت", callback_data="admin_settings")],
         [InlineKeyboardButton("⬅️ رجوع للقائمة الرئيسية", callback_data="act_back_to_menu")]
     ])
@@ -330,6 +332,22 @@ def admin_user_list_kb(page: int, total_users: int, items_per_page: int) -> Inli
     keyboard_rows.append([InlineKeyboardButton("⬅️ رجوع للوحة التحكم", callback_data="act_admin")])
     return InlineKeyboardMarkup(keyboard_rows)
 
+def admin_user_cursor_kb(first_id: int, last_id: int, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+    """Keyset pagination keyboard for the admin user list (buttons carry the edge user ids)."""
+    keyboard_rows = []
+    pagination_buttons = []
+    if has_prev:
+        pagination_buttons.append(InlineKeyboardButton("⬅️ السابق", callback_data=f"admin_users_prev_{first_id}"))
+    if has_next:
+        pagination_buttons.append(InlineKeyboardButton("التالي ➡️", callback_data=f"admin_users_next_{last_id}"))
+
+    if pagination_buttons:
+        keyboard_rows.append(pagination_buttons)
+
+    keyboard_rows.append([InlineKeyboardButton("✍️ تعديل بيانات مستخدم (أدخل ID)", callback_data="admin_pick_user_by_id")])
+    keyboard_rows.append([InlineKeyboardButton("⬅️ رجوع للوحة التحكم", callback_data="act_admin")])
+    return InlineKeyboardMarkup(keyboard_rows)
+
 def admin_user_view_kb(target_id: int) -> InlineKeyboardMarkup:
     """Keyboard for managing a specific user in the admin panel."""
     return InlineKeyboardMarkup([
@@ -0,0 +1,70 @@
+# update_processor.py
+"""Update processor: users run in parallel, each user's updates one at a time.
+
+Handlers still read a user's row, await AI/PDF work, then write the whole row
+back, so two updates for the same user must not interleave. Admin handlers that
+write *other* users' rows take those users' locks through user_row_guard().
+"""
+import asyncio
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, AsyncIterator, Awaitable, Dict, List
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor, ContextTypes
+
+import config
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Concurrent across users, sequential per user."""
+
+    def __init__(self, max_concurrent_updates: int = 256):
+        super().__init__(max_concurrent_updates)
+        # user_id -> [lock, عدد اللي ماسكينه/مستنيينه] عشان نمسح القفل لما يفضى
+        self._user_locks: Dict[int, List[Any]] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await coroutine
+            return
+        async with self._user_lock(user.id):
+            await coroutine
+
+    @asynccontextmanager
+    async def _user_lock(self, user_id: int) -> AsyncIterator[None]:
+        entry = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._user_locks.pop(user_id, None)
+
+    def hold_user(self, update: object, user_id: int):
+        """Lock another user's row from inside a handler, waiting for their in-flight update.
+
+        Only admins call this and admin targets are skipped, so the lock it waits on is
+        always held by a plain user's update, which never waits on anyone else's lock.
+        """
+        current = update.effective_user if isinstance(update, Update) else None
+        # قفل صاحب التحديث ماسكه هو أصلًا، وقفل أدمن تاني ممكن يعمل deadlock لو الاتنين بيعدلوا بعض
+        if (current is not None and current.id == user_id) or user_id in config.ADMIN_USER_IDS:
+            return nullcontext()
+        return self._user_lock(user_id)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def user_row_guard(update: object, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Context manager for an admin write to another user's whole row."""
+    processor = context.application.update_processor
+    if not isinstance(processor, PerUserUpdateProcessor):
+        return nullcontext()
+    return processor.hold_user(update, user_id)
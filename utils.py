@@ -1,5 +1,4 @@
 # utils.py
-import re
 import math
 import uuid
 import datetime as dt
@@ -21,9 +20,11 @@ LANGS = {
     }
 }
 
+_MD_ESCAPE = str.maketrans({c: "\\" + c for c in "_*`"})
+
 def safe_md(text: str) -> str:
     if not text: return ""
-    return re.sub(r'([_*`])', r'\\\1', text)
+    return text.translate(_MD_ESCAPE)
 
 def shorten(s: str, n: int = 400) -> str:
     s = s.strip()
@@ -25,6 +25,9 @@ except ImportError as e:
         @staticmethod
         def get_all_users_detailed():
             return []
+        @staticmethod
+        def get_top_users_by_files(n=5):
+            return []
     database = DummyDatabase()
 
 # --- إعداد التسجيل (Logging) ---
@@ -250,13 +253,10 @@ def dashboard():
                 "top_feature": "غير محدد"
             }
 
-        # 2. جلب بيانات المستخدمين
-        users = database.get_all_users_detailed() # افتراض إنها بترجع list of dicts
-        if not isinstance(users, list):
-            users = []
-        
-        # 3. ترتيب المستخدمين حسب عدد الملفات المُعالجة (من الأعلى للأدنى)
-        top_users = sorted(users, key=lambda u: safe_get(u, 'files_processed', 0), reverse=True)[:10]
+        # 2+3. أكثر 10 مستخدمين حسب عدد الملفات المُعالجة — الترتيب والـ LIMIT في SQL
+        top_users = database.get_top_users_by_files(10)
+        if not isinstance(top_users, list):
+            top_users = []
 
         # 4. عرض الصفحة باستخدام القالب
         return render_template_string(